@@ -0,0 +1,126 @@
+import heapq
+
+from classes import cost_tree, not_found
+
+
+class Agenda(object):
+    """Items (symbol, i, j) of a best-first parse in the manner of Knuth's
+    generalization of Dijkstra's algorithm. Items wait in a heap ordered by
+    their cost plus the outside bound of their symbol, which never
+    overestimates what the rest of a parse adds, so an item popped from the
+    heap has its final cost. Finished items are listed by start and by end
+    so that each one is combined only with the finished items next to it."""
+    def __init__(self, grammar, input_size, limit):
+        self.grammar = grammar
+        self.outside = grammar.outside_bounds()
+        self.limit = limit
+        self.rules_by_pair = dict(grammar.rules_by_pair())
+        self.rules_by_right = {}
+        for B, pairs in self.rules_by_pair.items():
+            for C, rules in pairs.items():
+                self.rules_by_right.setdefault(C, {})[B] = rules
+        self.best = {}
+        self.done = {}
+        self.starts = [[] for _ in range(input_size + 2)]
+        self.ends = [[] for _ in range(input_size + 2)]
+        self.heap = []
+
+    def push(self, symbol, i, j, errors):
+        """Adds the item unless it cannot be part of a parse within the
+        limit or a cheaper one is already known."""
+        estimate = errors + self.outside[symbol]
+        if estimate > self.limit or estimate == float('inf'):
+            return
+        key = (symbol, i, j)
+        if key in self.best and self.best[key] <= errors:
+            return
+        self.best[key] = errors
+        heapq.heappush(self.heap, (estimate, errors, symbol, i, j))
+
+    def pop(self, stop=None):
+        """Finishes the cheapest waiting item and returns it as (symbol, i,
+        j, errors), or returns None once every remaining estimate is above
+        stop."""
+        while self.heap:
+            estimate, errors, symbol, i, j = self.heap[0]
+            if stop is not None and estimate > stop:
+                return None
+            heapq.heappop(self.heap)
+            key = (symbol, i, j)
+            if key in self.done or self.best[key] != errors:
+                continue
+            self.done[key] = errors
+            self.combine(symbol, i, j, errors)
+            return key + (errors,)
+        return None
+
+    def combine(self, symbol, i, j, errors):
+        """Pushes every item made by a rule from the finished item and a
+        finished item next to it."""
+        self.starts[i].append((symbol, j, errors))
+        self.ends[j].append((symbol, i, errors))
+        pairs = self.rules_by_pair.get(symbol)
+        if pairs:
+            for C, k, l_2 in self.starts[j]:
+                for lhs, l_3, _ in pairs.get(C, ()):
+                    self.push(lhs, i, k, errors + l_2 + l_3)
+        pairs = self.rules_by_right.get(symbol)
+        if pairs:
+            for B, h, l_1 in self.ends[i]:
+                for lhs, l_3, _ in pairs.get(B, ()):
+                    self.push(lhs, h, j, l_1 + errors + l_3)
+
+
+def agenda_parser(grammar, input_string, max_errors=None):
+    """Takes a CompiledGrammar and an input string and returns the same
+    (errors, tree) tuple as error_correcting_parser. Items are finished in
+    order of their estimated cost and the parse stops once the top symbol
+    over the whole input is finished, so an input with few errors only
+    touches the cells of cheap items instead of the whole table. The items
+    that tie with the parse are still finished so that the tree is built
+    with the same choices as the cyk engine.
+    """
+    agenda, least_err = search(grammar, input_string, max_errors, True)
+    tree = agenda_tree(agenda, input_string, least_err)
+    return least_err, tree
+
+
+def agenda_distance(grammar, input_string, max_errors=None):
+    """Returns the distance of input_string to the grammar as found by
+    agenda_parser, without finishing the items that tie with it or building
+    a tree. With max_errors the search gives up, raising OverThreshold, as
+    soon as every waiting item is estimated above it."""
+    return search(grammar, input_string, max_errors, False)[1]
+
+
+def search(grammar, input_string, max_errors, ties):
+    """Runs an Agenda over input_string until the top symbol over the whole
+    input is finished, and then on through the items that tie with it when
+    ties is set. Returns the agenda and the least errors."""
+    input_size = len(input_string)
+    limit = float('inf') if max_errors is None else max_errors
+    agenda = Agenda(grammar, input_size, limit)
+    for i in range(1, input_size + 1):
+        for A, errors, _ in grammar.terminal_table.get(input_string[i-1], ()):
+            agenda.push(A, i, i+1, errors)
+    goal = (grammar.top, 1, input_size + 1)
+    least_err = None
+    while True:
+        item = agenda.pop(least_err)
+        if item is None:
+            break
+        if item[:3] == goal:
+            least_err = item[3]
+            if not ties:
+                break
+    if least_err is None:
+        raise not_found(max_errors)
+    return agenda, least_err
+
+
+def agenda_tree(agenda, input_string, errors):
+    """Builds the same parse tree as parse_tree from the finished items of an
+    Agenda."""
+    done = agenda.done
+    return cost_tree(agenda.grammar, input_string, errors,
+                     lambda symbol, i, j: done.get((symbol, i, j)))
@@ -0,0 +1,72 @@
+"""Times generate_cover.py on random grammars with a growing number of
+nonterminals, each with a few binary, unit and terminal productions.
+
+    $ python3 benchmarks/cover.py -n 100 200 400 800
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from generate_cover import Grammar, build_cover  # noqa: E402
+
+
+def random_grammar(size, rand, alphabet, per_symbol, units):
+    """Returns the lines of a grammar with size nonterminals. Productions
+    mostly refer to later symbols so that most of them derive a string, and
+    the last tenth only derive single characters."""
+    names = ['S'] + ['N{}'.format(index) for index in range(1, size)]
+    lines = []
+    for index, lhs in enumerate(names):
+        later = names[index + 1:] or [lhs]
+        for _ in range(per_symbol):
+            kind = rand.random()
+            errors = rand.choice([0, 0, 0, 1])
+            if index >= size - max(2, size // 10) or kind < 0.15:
+                lines.append('{} ->0 {}'.format(lhs, rand.choice(alphabet)))
+            elif kind < 0.15 + units:
+                lines.append('{} ->{} {}'.format(
+                    lhs, errors, rand.choice(later)))
+            else:
+                left = rand.choice(later if rand.random() < 0.9 else names)
+                lines.append('{} ->{} {} {}'.format(
+                    lhs, errors, left, rand.choice(later)))
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--sizes', type=int, nargs='+',
+                        default=[100, 200, 400, 800],
+                        help="numbers of nonterminals to time")
+    parser.add_argument('-p', '--per_symbol', type=int, default=3,
+                        help="productions of each nonterminal")
+    parser.add_argument('-u', '--units', type=float, default=0.1,
+                        help="share of unit productions")
+    parser.add_argument('-a', '--alphabet', default='acgt',
+                        help="terminal characters of the grammars")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rand = random.Random(args.seed)
+    print("{:>8} {:>12} {:>12} {:>10}".format(
+        'symbols', 'productions', 'cover', 'time'))
+    for size in args.sizes:
+        lines = random_grammar(size, rand, args.alphabet, args.per_symbol,
+                               args.units)
+        grammar = Grammar()
+        for line in lines:
+            grammar.add_production(line)
+        start = time.perf_counter()
+        cover = build_cover(grammar)
+        elapsed = time.perf_counter() - start
+        count = sum(len(productions)
+                    for productions in cover.productions.values())
+        print("{:>8} {:>12} {:>12} {:>9.3f}s".format(
+            size, len(lines), count, elapsed))
+
+if __name__ == '__main__':
+    main()
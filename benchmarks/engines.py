@@ -0,0 +1,90 @@
+"""Times the parsing engines of error_parser.py on random inputs of growing
+length and reports the first length at which each engine overtakes the
+baseline engine for good.
+
+    $ python3 benchmarks/engines.py -g grammar.txt -n 100 200 400 800 1600
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from classes import Grammar, CompiledGrammar  # noqa: E402
+from error_parser import error_correcting_parser, ENGINES  # noqa: E402
+
+
+def time_engine(grammar, input_string, engine, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = error_correcting_parser(grammar, input_string, engine)[0]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-g', '--grammar_file', default='grammar.txt',
+                        type=argparse.FileType('r'),
+                        help="grammar file of rule to use")
+    parser.add_argument('-n', '--lengths', type=int, nargs='+',
+                        default=[50, 100, 200, 400, 800],
+                        help="input lengths to time")
+    parser.add_argument('-e', '--engines', nargs='+',
+                        default=['numpy', 'valiant'],
+                        choices=['cyk'] + sorted(ENGINES),
+                        help="engines to time, the first is the baseline")
+    parser.add_argument('-a', '--alphabet', default='acgt',
+                        help="characters of the random inputs")
+    parser.add_argument('-r', '--repeat', type=int, default=1,
+                        help="runs per measurement, the fastest is kept")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    grammar = Grammar()
+    for line in args.grammar_file:
+        grammar.add_production(line)
+    grammar = CompiledGrammar(grammar)
+    rand = random.Random(args.seed)
+    baseline = args.engines[0]
+    faster = {engine: [] for engine in args.engines[1:]}
+    print("{:>8} ".format('n') +
+          " ".join("{:>12}".format(engine) for engine in args.engines))
+    for length in args.lengths:
+        input_string = "".join(
+            rand.choice(args.alphabet) for _ in range(length))
+        times = {}
+        errors = set()
+        for engine in args.engines:
+            times[engine], result = time_engine(grammar, input_string,
+                                                engine, args.repeat)
+            errors.add(result)
+        if len(errors) != 1:
+            raise AssertionError(
+                'Engines disagree on {!r}: {}'.format(input_string, errors))
+        for engine in args.engines[1:]:
+            faster[engine].append((length, times[engine] < times[baseline]))
+        print("{:>8} ".format(length) +
+              " ".join("{:>11.3f}s".format(times[engine])
+                       for engine in args.engines))
+    for engine in args.engines[1:]:
+        overtakes = None
+        for length, is_faster in faster[engine]:
+            if not is_faster:
+                overtakes = None
+            elif overtakes is None:
+                overtakes = length
+        if overtakes is not None:
+            print("{} overtakes {} from n = {}".format(
+                engine, baseline, overtakes))
+        else:
+            print("{} does not overtake {} for these lengths".format(
+                engine, baseline))
+
+if __name__ == '__main__':
+    main()
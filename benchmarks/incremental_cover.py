@@ -0,0 +1,197 @@
+"""Checks and times generate_cover.py --update against a full rebuild.
+
+The test grammars, or the grammar files given with -g, get a fixed series
+of edits: each of their productions is removed and given one more error,
+and each symbol gets a unit production, a pair and a terminal production
+of every character. Every edit is patched from the cover of the unedited
+grammar, and the first addition is also run through the command line. A
+random grammar of benchmarks/cover.py for every size of -n gets -e random
+edits instead, each adding a production or removing one and patched from
+the cover of the last. Every patched cover must be the same as build_cover
+of the edited grammar. Exits with status 1 when one differs.
+
+    $ python3 benchmarks/incremental_cover.py
+    $ python3 benchmarks/incremental_cover.py -g -n 200 400 -e 10
+    $ python3 benchmarks/incremental_cover.py -g my_grammar.txt -n
+"""
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from cover import random_grammar  # noqa: E402
+from generate_cover import (  # noqa: E402
+    Grammar, apply_diff, build_cover, update_cover)
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+GRAMMARS = [os.path.join(ROOT, 'test', name)
+            for name in ('grammar_dna_raw.txt', 'grammar_anbn_raw.txt')]
+
+
+def load(lines):
+    grammar = Grammar()
+    for line in lines:
+        grammar.add_production(line)
+    return grammar
+
+
+def fixed_edits(grammar):
+    """Returns the removals and changes of the productions of grammar and
+    the additions, as diffs of one line each."""
+    edits = []
+    for _, _, production in grammar.get_all(grammar.productions):
+        line = '{} ->{} {}'.format(production.lhs, production.errors,
+                                   production.rhs)
+        edits.append(['-' + line])
+        edits.append(['+{} ->{} {}'.format(
+            production.lhs, production.errors + 1, production.rhs)])
+    symbols = sorted(grammar.productions)
+    for index, lhs in enumerate(symbols):
+        after = symbols[(index + 1) % len(symbols)]
+        edits.append(['+{} ->0 {}'.format(lhs, after)])
+        edits.append(['+{} ->1 {} {}'.format(lhs, after, lhs)])
+        for char in sorted(grammar.chars):
+            edits.append(['+{} ->0 {}'.format(lhs, char)])
+    return edits
+
+
+def random_edit(lines, rand, alphabet):
+    """Returns a diff that removes a random production of lines or adds one
+    between two of their symbols."""
+    if len(lines) > 4 and rand.random() < 0.5:
+        return ['-' + rand.choice(lines)]
+    symbols = sorted({line.split('->')[0].strip() for line in lines})
+    lhs = rand.choice(symbols)
+    kind = rand.random()
+    if kind < 0.3:
+        rhs = rand.choice(alphabet)
+    elif kind < 0.6:
+        rhs = rand.choice(symbols)
+    else:
+        rhs = '{} {}'.format(rand.choice(symbols), rand.choice(symbols))
+    return ['+{} ->{} {}'.format(lhs, rand.choice([0, 0, 1]), rhs)]
+
+
+class Timing(object):
+    """Patches the covers of edits, checks them against a rebuild and sums
+    the time of both."""
+
+    def __init__(self, name):
+        self.name = name
+        self.edits = 0
+        self.failed = 0
+        self.full_time = self.update_time = 0.0
+
+    def edit(self, lines, cover, diff):
+        """Returns the lines of the grammar edited by diff and the lines of
+        its cover, which was patched from cover."""
+        new_lines = apply_diff(lines, diff)
+        start = time.perf_counter()
+        patched = update_cover(load(lines), cover, load(new_lines))
+        self.update_time += time.perf_counter() - start
+        start = time.perf_counter()
+        expected = str(build_cover(load(new_lines)))
+        self.full_time += time.perf_counter() - start
+        self.edits += 1
+        if patched != expected:
+            self.fail(diff[0])
+        return new_lines, expected.splitlines(True)
+
+    def fail(self, edit):
+        print("{}: cover differs after {}".format(self.name, edit.strip()))
+        self.failed += 1
+
+    def report(self):
+        print("{:>24} {:>6} {:>11.4f}s {:>11.4f}s {:>8.1f}x".format(
+            self.name, self.edits, self.full_time / self.edits,
+            self.update_time / self.edits,
+            self.full_time / self.update_time if self.update_time else 0.0))
+        return not self.failed
+
+
+def check_cli(path, diff, directory):
+    """Runs one edit of the grammar at path through generate_cover.py with
+    -o and --update and returns whether the two covers are the same."""
+    script = os.path.join(ROOT, 'generate_cover.py')
+    diff_path = os.path.join(directory, 'edit.diff')
+    with open(diff_path, 'w') as diff_file:
+        diff_file.write(diff[0] + '\n')
+    old, new, full = (os.path.join(directory, name)
+                      for name in ('old.txt', 'new.txt', 'full.txt'))
+    subprocess.check_call([sys.executable, script, path, '-o', old])
+    subprocess.check_call([sys.executable, script, path, '--diff',
+                           diff_path, '--update', old, '-o', new])
+    subprocess.check_call([sys.executable, script, path, '--diff',
+                           diff_path, '-o', full])
+    with open(new) as new_file, open(full) as full_file:
+        return new_file.read() == full_file.read()
+
+
+def check_fixed(path, directory):
+    """Runs the fixed edits on the grammar at path and returns whether
+    every patched cover was right."""
+    with open(path) as grammar_file:
+        lines = [line.rstrip('\n') + '\n' for line in grammar_file
+                 if line.strip()]
+    timing = Timing(os.path.basename(path))
+    cover = str(build_cover(load(lines))).splitlines(True)
+    edits = fixed_edits(load(lines))
+    for diff in edits:
+        timing.edit(lines, cover, diff)
+    addition = next(diff for diff in edits if diff[0].startswith('+'))
+    if not check_cli(path, addition, directory):
+        timing.fail('command line ' + addition[0])
+    return timing.report()
+
+
+def check_random(name, lines, edits, rand, alphabet):
+    """Runs edits random edits on the grammar lines, each on the last, and
+    returns whether every patched cover was right."""
+    lines = [line.rstrip('\n') + '\n' for line in lines if line.strip()]
+    timing = Timing(name)
+    cover = str(build_cover(load(lines))).splitlines(True)
+    for _ in range(edits):
+        lines, cover = timing.edit(lines, cover,
+                                   random_edit(lines, rand, alphabet))
+    return timing.report()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-g', '--grammar_files', nargs='*', default=GRAMMARS,
+                        help="grammar files to give the fixed edits")
+    parser.add_argument('-n', '--sizes', type=int, nargs='*',
+                        default=[100, 200],
+                        help="numbers of nonterminals of random grammars")
+    parser.add_argument('-e', '--edits', type=int, default=10,
+                        help="random edits of each random grammar")
+    parser.add_argument('-p', '--per_symbol', type=int, default=3,
+                        help="productions of each nonterminal")
+    parser.add_argument('-u', '--units', type=float, default=0.1,
+                        help="share of unit productions")
+    parser.add_argument('-a', '--alphabet', default='acgt',
+                        help="terminal characters of the random grammars")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rand = random.Random(args.seed)
+    print("{:>24} {:>6} {:>12} {:>12} {:>9}".format(
+        'grammar', 'edits', 'rebuild', 'update', 'speedup'))
+    good = True
+    with tempfile.TemporaryDirectory() as directory:
+        for path in args.grammar_files:
+            good &= check_fixed(path, directory)
+    for size in args.sizes:
+        lines = random_grammar(size, rand, args.alphabet, args.per_symbol,
+                               args.units)
+        good &= check_random('random {}'.format(size), lines, args.edits,
+                             rand, args.alphabet)
+    sys.exit(0 if good else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Load test of parse_server.py: opens a number of concurrent connections
+that each send requests for random lines of an input file, one at a time,
+and reports the throughput and the latency percentiles.
+
+    $ python3 parse_server.py -g grammar.txt -u /tmp/parser.sock -j 4 &
+    $ python3 benchmarks/server_load.py -u /tmp/parser.sock \
+          -i test/input_strings.txt -c 8 -n 400
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+
+async def run_connection(args, input_strings, rand, count, latencies):
+    if args.socket:
+        reader, writer = await asyncio.open_unix_connection(args.socket)
+    else:
+        reader, writer = await asyncio.open_connection('127.0.0.1', args.port)
+    for request_id in range(count):
+        request = {'id': request_id, 'input': rand.choice(input_strings)}
+        if args.max_errors is not None:
+            request['max_errors'] = args.max_errors
+        if args.engine is not None:
+            request['engine'] = args.engine
+        start = time.perf_counter()
+        writer.write(json.dumps(request).encode('utf-8') + b'\n')
+        await writer.drain()
+        response = json.loads(await reader.readline())
+        latencies.append(time.perf_counter() - start)
+        if 'error' in response:
+            raise RuntimeError(response['error'])
+    writer.close()
+    await writer.wait_closed()
+
+
+def percentile(values, share):
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+async def run_load(args, input_strings):
+    rand = random.Random(args.seed)
+    latencies = []
+    counts = [args.requests // args.connections] * args.connections
+    for index in range(args.requests % args.connections):
+        counts[index] += 1
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        run_connection(args, input_strings, random.Random(rand.random()),
+                       count, latencies)
+        for count in counts])
+    return time.perf_counter() - start, sorted(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    server = parser.add_mutually_exclusive_group(required=True)
+    server.add_argument('-u', '--socket', help="Unix socket of the server")
+    server.add_argument('-p', '--port', type=int,
+                        help="localhost TCP port of the server")
+    parser.add_argument('-i', '--input_file', required=True,
+                        type=argparse.FileType('r'),
+                        help="file of strings to send")
+    parser.add_argument('-c', '--connections', type=int, default=4,
+                        help="number of concurrent connections")
+    parser.add_argument('-n', '--requests', type=int, default=100,
+                        help="number of requests over all connections")
+    parser.add_argument('-e', '--engine', help="parsing engine to ask for")
+    parser.add_argument('-k', '--max-errors', type=int,
+                        help="bound on the errors of a correction")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    input_strings = [line.strip() for line in args.input_file
+                     if line.strip()]
+    elapsed, latencies = asyncio.run(run_load(args, input_strings))
+    print("{} requests over {} connections in {:.3f}s, {:.1f} requests/s"
+          .format(len(latencies), args.connections, elapsed,
+                  len(latencies) / elapsed))
+    print("latency p50 {:.4f}s p95 {:.4f}s p99 {:.4f}s max {:.4f}s".format(
+        percentile(latencies, 0.5), percentile(latencies, 0.95),
+        percentile(latencies, 0.99), latencies[-1]))
+
+if __name__ == '__main__':
+    main()
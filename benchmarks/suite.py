@@ -0,0 +1,366 @@
+"""Benchmark suite over synthetic grammars of growing size, inputs of
+controlled length and a controlled number of injected errors.
+
+Two families of grammars are built: 'anbn', the balanced strings of size
+pairs of brackets a^n b^n (size 1 is test/grammar_anbn_raw.txt), and 'dna',
+the DNA strings made of size random motifs of 4 to 8 bases one after the
+other. For each grammar generate_cover.py is timed, and each engine parses
+inputs that are members of the grammar, of the shortest length from the
+given one up that it has, with the given number of random insertions,
+deletions and replacements. Each engine must find the same distances as the
+first one, and none above the number of injected errors.
+
+Every measurement is written as one JSON line to --output. The first line
+describes the run, "cover" lines time the covering grammars and "parse"
+lines give, for each grammar, length, error count and engine, the
+throughput, the latency of single inputs and the peak memory of a parse.
+--compare prints how the times of a run differ from those of an earlier
+one:
+
+    $ python3 benchmarks/suite.py -o base.jsonl
+    $ python3 benchmarks/suite.py -o new.jsonl --compare base.jsonl
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import random
+import string
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from classes import Production  # noqa: E402
+from error_parser import (ENGINES, error_correcting_parser,  # noqa: E402
+                          load_grammar)
+from generate_cover import Grammar, build_cover  # noqa: E402
+
+BASES = 'acgt'
+# Shortest and longest motifs of the dna grammars.
+MOTIF_SIZES = (4, 8)
+
+
+def anbn_grammar(size, rand):  # pylint: disable=W0613
+    """Returns the lines of the grammar of balanced strings over size pairs
+    of brackets, the first being a and b."""
+    letters = string.ascii_lowercase
+    lines = []
+    for pair in range(1, size + 1):
+        opening, closing = letters[2 * pair - 2], letters[2 * pair - 1]
+        lines += ['S ->0 A{0} X{0}'.format(pair),
+                  'S ->0 A{0} B{0}'.format(pair),
+                  'X{0} ->0 S B{0}'.format(pair),
+                  'A{0} ->0 {1}'.format(pair, opening),
+                  'B{0} ->0 {1}'.format(pair, closing)]
+    if size > 1:
+        lines.append('S ->0 S S')
+    return lines
+
+
+def dna_grammar(size, rand):
+    """Returns the lines of a grammar of the DNA strings made of size random
+    motifs one after the other, each motif built base by base as in
+    test/grammar_dna_raw.txt."""
+    lines = ['B{} ->0 {}'.format(base.upper(), base) for base in BASES]
+    for motif in range(1, size + 1):
+        bases = ['B' + rand.choice(BASES).upper()
+                 for _ in range(rand.randint(*MOTIF_SIZES))]
+        name = 'M{}_'.format(motif)
+        lines.append('{}2 ->0 {} {}'.format(name, bases[0], bases[1]))
+        for index in range(2, len(bases)):
+            lines.append('{0}{1} ->0 {0}{2} {3}'.format(
+                name, index + 1, index, bases[index]))
+        lines.append('S ->0 S {}{}'.format(name, len(bases)))
+        lines.append('S ->0 {}{}'.format(name, len(bases)))
+    return lines
+
+
+FAMILIES = {
+    'anbn': anbn_grammar,
+    'dna': dna_grammar,
+}
+
+
+class Sampler(object):
+    """Draws strings of a given length from a grammar of binary, unit and
+    terminal productions. lengths maps each symbol to a bitmask of the
+    lengths up to max_length it derives."""
+    def __init__(self, lines, max_length):
+        self.rules = {}
+        for line in lines:
+            production = Production(line)
+            self.rules.setdefault(production.lhs, []).append(
+                production.rhs.split())
+        mask = (1 << (max_length + 1)) - 1
+        self.lengths = {symbol: 0 for symbol in self.rules}
+        changed = True
+        while changed:
+            changed = False
+            for symbol, rules in self.rules.items():
+                lengths = self.lengths[symbol]
+                for rhs in rules:
+                    lengths |= self.rule_lengths(rhs) & mask
+                if lengths != self.lengths[symbol]:
+                    self.lengths[symbol] = lengths
+                    changed = True
+
+    def symbol_lengths(self, symbol):
+        return self.lengths.get(symbol, 2 if symbol not in self.rules else 0)
+
+    def rule_lengths(self, rhs):
+        if len(rhs) == 1:
+            return self.symbol_lengths(rhs[0])
+        left, right = map(self.symbol_lengths, rhs)
+        lengths, shift = 0, 0
+        while left >> shift:
+            if left >> shift & 1:
+                lengths |= right << shift
+            shift += 1
+        return lengths
+
+    def derives(self, symbol, length):
+        return self.symbol_lengths(symbol) >> length & 1
+
+    def next_length(self, symbol, length):
+        """Returns the shortest length from length up that symbol derives,
+        or None."""
+        lengths = self.symbol_lengths(symbol) >> length
+        if not lengths:
+            return None
+        return length + (lengths & -lengths).bit_length() - 1
+
+    def sample(self, symbol, length, rand):
+        """Returns a random string of length derived from symbol."""
+        if symbol not in self.rules:
+            return symbol
+        choices = []
+        for rhs in self.rules[symbol]:
+            if len(rhs) == 1:
+                if self.derives(rhs[0], length):
+                    choices.append((rhs, None))
+            else:
+                choices += [(rhs, split) for split in range(1, length)
+                            if self.derives(rhs[0], split) and
+                            self.derives(rhs[1], length - split)]
+        rhs, split = rand.choice(choices)
+        if split is None:
+            return self.sample(rhs[0], length, rand)
+        return (self.sample(rhs[0], split, rand) +
+                self.sample(rhs[1], length - split, rand))
+
+
+def inject_errors(input_string, count, alphabet, rand):
+    """Returns input_string with count random insertions, deletions and
+    replacements of characters of alphabet."""
+    chars = list(input_string)
+    for _ in range(count):
+        kind = rand.choice(['insert', 'delete', 'replace'] if chars
+                           else ['insert'])
+        if kind == 'insert':
+            chars.insert(rand.randint(0, len(chars)), rand.choice(alphabet))
+        elif kind == 'delete':
+            del chars[rand.randrange(len(chars))]
+        else:
+            index = rand.randrange(len(chars))
+            chars[index] = rand.choice(
+                [char for char in alphabet if char != chars[index]] or
+                alphabet)
+    return "".join(chars)
+
+
+def parse_errors(grammar, input_string, engine, max_errors):
+    try:
+        return error_correcting_parser(grammar, input_string, engine,
+                                       max_errors)[0]
+    except LookupError:
+        return None
+
+
+def peak_memory(grammar, input_string, engine, max_errors):
+    """Returns the peak of the memory allocated while parsing, in bytes."""
+    tracemalloc.start()
+    try:
+        parse_errors(grammar, input_string, engine, max_errors)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+def run_info(args):
+    """Returns the first record of a run."""
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'event': 'run', 'commit': commit,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': importlib.util.find_spec('numpy') is not None,
+            'args': {name: value for name, value in vars(args).items()
+                     if name not in ('output', 'compare')}}
+
+
+def bench_grammar(args, family, size, rand, write):
+    """Times the cover of one grammar and the engines on its inputs, and
+    returns whether every engine agreed."""
+    lines = FAMILIES[family](size, rand)
+    grammar = Grammar()
+    for line in lines:
+        grammar.add_production(line)
+    start = time.perf_counter()
+    cover = build_cover(grammar)
+    elapsed = time.perf_counter() - start
+    cover_lines = str(cover).splitlines(True)
+    write({'event': 'cover', 'family': family, 'size': size,
+           'productions': len(lines), 'cover_productions': len(cover_lines),
+           'seconds': elapsed})
+    compiled = load_grammar(cover_lines)
+    alphabet = sorted(grammar.chars)
+    sampler = Sampler(lines, 2 * max(args.lengths))
+    correct = True
+    for length in args.lengths:
+        sample_length = sampler.next_length('S', length)
+        if sample_length is None:
+            continue
+        for count in args.errors:
+            inputs = [inject_errors(sampler.sample('S', sample_length, rand),
+                                    count, alphabet, rand)
+                      for _ in range(args.inputs)]
+            expected = None
+            for engine in args.engines:
+                # The first parse imports the engine and builds the tables
+                # it keeps with the grammar, which is not timed.
+                parse_errors(compiled, inputs[0], engine, args.max_errors)
+                latencies, found = [], []
+                for input_string in inputs:
+                    best = None
+                    for _ in range(args.repeat):
+                        start = time.perf_counter()
+                        errors = parse_errors(compiled, input_string, engine,
+                                              args.max_errors)
+                        elapsed = time.perf_counter() - start
+                        best = elapsed if best is None else min(best,
+                                                                elapsed)
+                    latencies.append(best)
+                    found.append(errors)
+                if expected is None:
+                    expected = found
+                agrees = found == expected and all(
+                    errors is None or errors <= count for errors in found)
+                correct = correct and agrees
+                total = sum(latencies)
+                write({'event': 'parse', 'family': family, 'size': size,
+                       'symbols': compiled.size,
+                       'rules': len(compiled.rule_lhs), 'length': length,
+                       'sample_length': sample_length, 'injected': count,
+                       'engine': engine,
+                       'inputs': len(inputs), 'seconds': total,
+                       'inputs_per_s': len(inputs) / total,
+                       'symbols_per_s': sum(map(len, inputs)) / total,
+                       'latency_p50': percentile(latencies, 0.5),
+                       'latency_p95': percentile(latencies, 0.95),
+                       'latency_max': max(latencies),
+                       'peak_bytes': peak_memory(compiled, inputs[0], engine,
+                                                 args.max_errors),
+                       'errors': found, 'correct': agrees})
+    return correct
+
+
+def record_key(record):
+    return tuple(record.get(name) for name in (
+        'event', 'family', 'size', 'length', 'injected', 'engine'))
+
+
+def compare(old_path, records):
+    """Prints the time of every record next to that of the matching record
+    of an earlier run."""
+    with open(old_path) as old_file:
+        old = {record_key(record): record
+               for record in map(json.loads, old_file)
+               if 'seconds' in record}
+    print("{:>6} {:>5} {:>6} {:>3} {:>10} {:>10} {:>10} {:>7}".format(
+        'family', 'size', 'length', 'err', 'engine', 'old', 'new',
+        'ratio'), file=sys.stderr)
+    for record in records:
+        before = old.get(record_key(record))
+        if before is None or 'seconds' not in record:
+            continue
+        print("{:>6} {:>5} {:>6} {:>3} {:>10} {:>9.4f}s {:>9.4f}s {:>7.2f}"
+              .format(record['family'], record['size'],
+                      record.get('length', '-'), record.get('injected', '-'),
+                      record.get('engine', 'cover'), before['seconds'],
+                      record['seconds'],
+                      record['seconds'] / before['seconds']),
+              file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-f', '--families', nargs='+',
+                        default=sorted(FAMILIES), choices=sorted(FAMILIES),
+                        help="grammar families to run")
+    parser.add_argument('-n', '--sizes', type=int, nargs='+',
+                        default=[1, 2, 4, 8],
+                        help="sizes of the grammars: bracket pairs of anbn, "
+                        "motifs of dna")
+    parser.add_argument('-l', '--lengths', type=int, nargs='+',
+                        default=[16, 32, 64],
+                        help="lengths of the inputs before errors, raised "
+                        "to the next length the grammar has")
+    parser.add_argument('-x', '--errors', type=int, nargs='+',
+                        default=[0, 1, 4],
+                        help="numbers of errors injected into each input")
+    parser.add_argument('-e', '--engines', nargs='+',
+                        default=['cyk', 'agenda'],
+                        choices=['cyk'] + sorted(ENGINES),
+                        help="engines to run, the first one is checked "
+                        "against")
+    parser.add_argument('-c', '--inputs', type=int, default=3,
+                        help="inputs of each length and error count")
+    parser.add_argument('-r', '--repeat', type=int, default=1,
+                        help="runs of each input, the fastest is kept")
+    parser.add_argument('-k', '--max-errors', type=int,
+                        help="bound on the errors of a correction")
+    parser.add_argument('-o', '--output', type=argparse.FileType('w'),
+                        default=sys.stdout, help="file of the JSON lines")
+    parser.add_argument('--compare', metavar='PATH',
+                        help="JSON lines of an earlier run to compare with")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    if max(args.sizes) > 13 and 'anbn' in args.families:
+        parser.error("anbn grammars have at most 13 bracket pairs")
+
+    records = []
+
+    def write(record):
+        records.append(record)
+        args.output.write(json.dumps(record) + "\n")
+        args.output.flush()
+
+    write(run_info(args))
+    correct = True
+    for family in args.families:
+        for size in args.sizes:
+            rand = random.Random('{}:{}:{}'.format(args.seed, family, size))
+            correct = bench_grammar(args, family, size, rand,
+                                    write) and correct
+    if args.compare:
+        compare(args.compare, records)
+    if not correct:
+        print("engines disagree, see the records with \"correct\": false",
+              file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Counts the work of the cyk engine of error_parser.py on the lines of an
+input file: the cell entries fill_cell visits, the pairs of them that some
+rule combines, and the entries a fill that looks up every B and every rule
+pair at every split would visit.
+
+    $ python3 benchmarks/visited.py -i test/input_strings.txt -k 10
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import error_parser  # noqa: E402
+from classes import Matrix  # noqa: E402
+
+# Matrices made by error_correcting_parser, in order.
+matrices = []
+
+
+class RecordedMatrix(Matrix):
+    def __init__(self, *args, **kwargs):
+        Matrix.__init__(self, *args, **kwargs)
+        matrices.append(self)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-g', '--grammar_file', default='grammar.txt',
+                        type=argparse.FileType('r'),
+                        help="grammar file of rule to use")
+    parser.add_argument('-i', '--input_file', required=True,
+                        type=argparse.FileType('r'),
+                        help="file with one input string per line")
+    parser.add_argument('-k', '--max-errors', type=int, default=None,
+                        dest='max_errors',
+                        help="bound on the errors of a correction")
+    args = parser.parse_args()
+
+    grammar = error_parser.load_grammar(args.grammar_file.readlines())
+    by_pair = list(grammar.rules_by_pair())
+    lookups = len(by_pair) + sum(len(by_right) for _, by_right in by_pair)
+    error_parser.Matrix = RecordedMatrix
+    print("{:>8} {:>12} {:>12} {:>12}".format(
+        'n', 'full scan', 'visited', 'combined'))
+    for line in args.input_file:
+        input_string = line.strip()
+        if not input_string:
+            continue
+        try:
+            error_parser.error_correcting_parser(
+                grammar, input_string, max_errors=args.max_errors)
+        except LookupError:
+            pass
+        matrix = matrices.pop()
+        size = len(input_string)
+        splits = (size + 1) * size * (size - 1) // 6
+        print("{:>8} {:>12} {:>12} {:>12}".format(
+            size, splits * lookups, matrix.visited, matrix.combined))
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,27 @@
+import hashlib
 import re
+from array import array
 
+# Errors stored in the arrays of Matrix for a symbol that has no entry in a
+# cell. Real error counts stay far below it.
+UNREACHABLE = 0xFFFF
 
-class BreakIt(Exception):
-    """Exception used as a nested break"""
+
+class OverThreshold(LookupError):
+    """Raised by a bounded parse when no correction is within the allowed
+    number of errors."""
     pass
 
 
+def not_found(max_errors):
+    """Returns the error raised when a parse with at most max_errors errors
+    (any number when None) does not exist."""
+    if max_errors is None:
+        return LookupError('Correction not found. Incomplete input grammar.')
+    return OverThreshold(
+        'No correction with at most {} errors.'.format(max_errors))
+
+
 class Production(object):
     """Production conatins a left hand side, right hand side and number of
     errors for the production as well as tagging information for inserted,
@@ -14,13 +30,13 @@ class Production(object):
     EPSILON = '__e'
     H_SYM = '__H'
     I_SYM = '__I'
+    __slots__ = ('lhs', 'errors', 'rhs', 'inserted', 'deleted', 'replaced',
+                 'prefix', 'suffix')
 
     def __init__(self, arg0, arg1=None, arg2=None):
         """
         Creates a new 'Production' object.
         """
-        self.exclude_nullable = False
-        self.exclude_units = False
         self.inserted = False
         self.deleted = ""
         self.replaced = ""
@@ -142,59 +158,251 @@ class Grammar(object):
         return string[:-1]
 
 
-class Lookup(object):
-    """Lookup List that contains the best productions for a given desired
-    transition. Although called a list, this structure is made up of
-    dicts."""
-    def __init__(self, productions, size):
-        self.data = {}
-        for key in productions:
-            self.data[key] = []
-            for _ in range(0, size):
-                self.data[key].append({})
-
-    def insert(self, symbol, i, j, errors):
-        tup_hash = self.data[symbol][i-1]
-        if j in tup_hash:
-            if tup_hash[j][2] <= errors:
-                return
-        tup_hash[j] = (i, j, errors)
-
-    def get_all(self, symbol, depth, input_size):
-        j_boundry = None
-        for i, tup_hash in enumerate(self.data[symbol]):
-            j_boundry = i + 1 + depth
-            if j_boundry <= input_size + 1:
-                for j, tup in list(tup_hash.items()):
-                    if j < j_boundry:
-                        yield tup
-
-    def get(self, symbol, i):
-        return self.data[symbol][i-1]
+class CompiledGrammar(object):
+    """Integer-indexed form of a Grammar that is built once and used by the
+    parser. Symbols are interned as small ints, binary productions are stored
+    as flat arrays of (lhs, B, C, cost) and terminal productions as a table
+    of (symbol, cost, production) entries for each character. Without a
+    grammar the fields are left empty to be filled in by a loader, which then
+    calls index_rules."""
+    def __init__(self, grammar=None):
+        self.symbols = []
+        self.index = {}
+        self.rule_lhs = array('i')
+        self.rule_left = array('i')
+        self.rule_right = array('i')
+        self.rule_cost = array('i')
+        self.rule_production = []
+        self.terminal_table = {}
+        if grammar is None:
+            return
+        for lhs in grammar.productions:
+            self.intern(lhs)
+        for lhs, rhs, production in grammar.get_all(grammar.nonterminals):
+            try:
+                rhs_b, rhs_c = rhs.split()
+            except ValueError:
+                raise ValueError(
+                    "Covering grammar must be in Chomsky Normal Form\n" +
+                    "Cannot use {}".format(production))
+            self.rule_lhs.append(self.intern(lhs))
+            self.rule_left.append(self.intern(rhs_b))
+            self.rule_right.append(self.intern(rhs_c))
+            self.rule_cost.append(production.errors)
+            self.rule_production.append(production)
+        for lhs, rhs, production in grammar.get_all(grammar.terminals):
+            self.terminal_table.setdefault(rhs, []).append(
+                (self.index[lhs], production.errors, production))
+        self.index_rules()
+
+    def index_rules(self):
+        """Builds the rule lists of each symbol from the flat arrays."""
+        self.lhs_rules = [[] for _ in self.symbols]
+        for rule, lhs in enumerate(self.rule_lhs):
+            self.lhs_rules[lhs].append(rule)
+        self.top = self.index.get(Grammar.TOP_SYMBOL)
+
+    @property
+    def size(self):
+        return len(self.symbols)
+
+    def intern(self, symbol):
+        if symbol not in self.index:
+            self.index[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        return self.index[symbol]
+
+    def rules(self):
+        return zip(self.rule_lhs, self.rule_left, self.rule_right,
+                   self.rule_cost, self.rule_production)
+
+    def rules_by_pair(self):
+        """Yields each symbol B together with a dict mapping C to the (lhs,
+        cost, rule) of every rule lhs -> B C in rule order, so that the entry
+        of C in a cell is read once for all of them."""
+        by_left = {}
+        for rule, (lhs, left, right, cost, _) in enumerate(self.rules()):
+            by_left.setdefault(left, {}).setdefault(right, []).append(
+                (lhs, cost, rule))
+        for left in sorted(by_left):
+            yield left, by_left[left]
+
+    def pair_rules(self, limits):
+        """Returns a dict mapping each symbol B of rules_by_pair to a dict
+        from C to the (lhs, cost, rule, limit) entries of the rules
+        lhs -> B C, where limit is the entry of lhs in limits."""
+        return {B: {C: [(lhs, l_3, rule, limits[lhs])
+                        for lhs, l_3, rule in rules]
+                    for C, rules in pairs.items()}
+                for B, pairs in self.rules_by_pair()}
+
+    def inside_bounds(self):
+        """Returns, for every symbol, the lowest cost of any string it
+        derives."""
+        inside = [float('inf')] * self.size
+        for entries in self.terminal_table.values():
+            for A, errors, _ in entries:
+                inside[A] = min(inside[A], errors)
+        changed = True
+        while changed:
+            changed = False
+            for lhs, B, C, cost, _ in self.rules():
+                if inside[B] + inside[C] + cost < inside[lhs]:
+                    inside[lhs] = inside[B] + inside[C] + cost
+                    changed = True
+        return inside
+
+    def outside_bounds(self):
+        """Returns, for every symbol A, a lower bound on the cost that the
+        rest of a parse of the top symbol adds to an entry of A: the cheapest
+        chain of rules from the top symbol down to A with the lowest inside
+        cost of every sibling along the way. Symbols that cannot be part of
+        a parse get infinity. The result is computed once and kept."""
+        if getattr(self, 'outside', None) is not None:
+            return self.outside
+        inside = self.inside_bounds()
+        outside = [float('inf')] * self.size
+        if self.top is not None:
+            outside[self.top] = 0
+        changed = True
+        while changed:
+            changed = False
+            for lhs, B, C, cost, _ in self.rules():
+                if outside[lhs] + cost + inside[C] < outside[B]:
+                    outside[B] = outside[lhs] + cost + inside[C]
+                    changed = True
+                if outside[lhs] + cost + inside[B] < outside[C]:
+                    outside[C] = outside[lhs] + cost + inside[B]
+                    changed = True
+        self.outside = outside
+        return outside
+
+    def content_hash(self):
+        """Returns the SHA-256 hex digest of every production of the grammar
+        in order, which identifies its results. The digest is computed once
+        and kept."""
+        if getattr(self, 'digest', None) is None:
+            sha = hashlib.sha256()
+            productions = list(self.rule_production)
+            for char in sorted(self.terminal_table):
+                productions.extend(production for _, _, production
+                                   in self.terminal_table[char])
+            for production in productions:
+                sha.update(repr(production).encode('utf-8') + b'\n')
+            self.digest = sha.hexdigest()
+        return self.digest
+
+    def error_limits(self, max_errors):
+        """Returns, for every symbol, the highest cost one of its entries may
+        have in a parse with at most max_errors errors (infinity when
+        unbounded)."""
+        if max_errors is None:
+            return [float('inf')] * self.size
+        return [max_errors - bound for bound in self.outside_bounds()]
 
     def __repr__(self):
-        return str(self.data.keys())
+        return "CompiledGrammar({} symbols, {} rules, {} characters)".format(
+            self.size, len(self.rule_lhs), len(self.terminal_table))
 
 
 class Matrix(object):
     """CYK Matrix object that contains the productions for each cell of
     the CYK matrix. This structure is built while the parser is being
-    run"""
-    def __init__(self, size):
+    run. Row i holds the cells (i, j) one after the other as runs of width
+    errors, one per symbol, next to the index of the production that gave
+    each of them and the split point k of its two halves (i, k) and (k, j).
+    Productions passed at creation keep their position as index, so giving
+    the binary rules of a CompiledGrammar makes each choice a rule index.
+    The symbols of each cell are also listed in the order they were first
+    stored, so that a fill visits only the entries a cell has, and visited
+    and combined count the entries read that way and the pairs of them that
+    some rule combined. tried counts the entries offered to the matrix and
+    improved those of them that were stored."""
+    def __init__(self, size, width, productions=()):
         self.size = size
-        self.data = [None] * size
-        for i in range(0, size):
-            self.data[i] = [{} for _ in range(size-i)]
-
-    def insert(self, symbol, i, j, errors, production):
-        tup_hash = self.data[i-1][j-i-1]
-        if symbol in tup_hash:
-            if tup_hash[symbol][1] <= errors:
-                return
-        tup_hash[symbol] = (symbol, errors, production)
+        self.width = width
+        self.productions = []
+        self.production_index = {}
+        for production in productions:
+            self.intern(production)
+        self.costs = [array('H', [UNREACHABLE]) * ((size - i) * width)
+                      for i in range(0, size)]
+        self.choices = [array('I', [0]) * ((size - i) * width)
+                        for i in range(0, size)]
+        self.splits = [array('I', [0]) * ((size - i) * width)
+                       for i in range(0, size)]
+        self.entries = [[array('H') for _ in range(size - i)]
+                        for i in range(0, size)]
+        self.visited = 0
+        self.combined = 0
+        self.tried = 0
+        self.improved = 0
+
+    def intern(self, production):
+        key = id(production)
+        if key not in self.production_index:
+            self.production_index[key] = len(self.productions)
+            self.productions.append(production)
+        return self.production_index[key]
+
+    def insert(self, symbol, i, j, errors, production, split=0):
+        """Keeps the entry with the fewest errors. Between equal ones the
+        lowest split, and then the lowest production index, is kept, which
+        is the first match a search over the splits and rules in order would
+        find."""
+        self.tried += 1
+        row = self.costs[i-1]
+        index = (j-i-1) * self.width + symbol
+        if row[index] < errors:
+            return
+        choice = self.intern(production)
+        if row[index] == errors and (self.splits[i-1][index],
+                                     self.choices[i-1][index]) <= (split,
+                                                                   choice):
+            return
+        if row[index] == UNREACHABLE:
+            self.entries[i-1][j-i-1].append(symbol)
+        row[index] = errors
+        self.choices[i-1][index] = choice
+        self.splits[i-1][index] = split
+        self.improved += 1
+
+    def backpointer(self, symbol, i, j):
+        """Returns the (errors, choice, split) of the entry of symbol in cell
+        (i, j), where choice is the index of its production."""
+        index = (j-i-1) * self.width + symbol
+        return (self.costs[i-1][index], self.choices[i-1][index],
+                self.splits[i-1][index])
 
     def get(self, i, j):
-        return self.data[i-1][j-i-1]
+        return Cell(self, i, j)
+
+    def cells(self):
+        return self.size * (self.size + 1) // 2
+
+    def nbytes(self):
+        """Returns the bytes held by the arrays of the matrix."""
+        total = 0
+        for rows in (self.costs, self.choices, self.splits):
+            total += sum(len(row) * row.itemsize for row in rows)
+        for cells in self.entries:
+            total += sum(len(cell) * cell.itemsize for cell in cells)
+        return total
+
+    def add_column(self):
+        """Grows the matrix by one input position, adding the cells that end
+        after it."""
+        for row in self.costs:
+            row.extend(array('H', [UNREACHABLE]) * self.width)
+        for rows in (self.choices, self.splits):
+            for row in rows:
+                row.extend(array('I', [0]) * self.width)
+            rows.append(array('I', [0]) * self.width)
+        self.costs.append(array('H', [UNREACHABLE]) * self.width)
+        for cells in self.entries:
+            cells.append(array('H'))
+        self.entries.append([array('H')])
+        self.size += 1
 
     def __repr__(self):
         str_list = []
@@ -207,9 +415,48 @@ class Matrix(object):
         return "".join(str_list)
 
 
+class Cell(object):
+    """Read only view of one Matrix cell that maps each symbol with an entry
+    to its (symbol, errors, production) tuple."""
+    __slots__ = ('matrix', 'row', 'base')
+
+    def __init__(self, matrix, i, j):
+        self.matrix = matrix
+        self.row = i - 1
+        self.base = (j-i-1) * matrix.width
+
+    def __contains__(self, symbol):
+        return self.matrix.costs[self.row][self.base + symbol] != UNREACHABLE
+
+    def __getitem__(self, symbol):
+        tup = self.get(symbol)
+        if tup is None:
+            raise KeyError(symbol)
+        return tup
+
+    def get(self, symbol, default=None):
+        matrix = self.matrix
+        errors = matrix.costs[self.row][self.base + symbol]
+        if errors == UNREACHABLE:
+            return default
+        choice = matrix.choices[self.row][self.base + symbol]
+        return symbol, errors, matrix.productions[choice]
+
+    def items(self):
+        for symbol in range(self.matrix.width):
+            tup = self.get(symbol)
+            if tup is not None:
+                yield symbol, tup
+
+    def values(self):
+        return (tup for _, tup in self.items())
+
+
 class Node(object):
     """Node/Tree object that contains the parsing information for the
     CYK matrix and corresponding tree."""
+    __slots__ = ('i', 'j', 'production', 'left', 'right')
+
     def __init__(self, i, j, production):
         self.i = i
         self.j = j
@@ -230,3 +477,53 @@ class Node(object):
 
     def __repr__(self):
         return self.print_tree(0, "")
+
+
+def leaf_production(grammar, node, symbol, errors, input_string):
+    """Returns the first terminal production of symbol for the character of
+    the leaf node whose cost is errors."""
+    for A, cost, production in grammar.terminal_table.get(
+            input_string[node.i-1], ()):
+        if A == symbol and cost == errors:
+            return production
+    raise LookupError('Could not find {} in table at {}'.format(
+        grammar.symbols[symbol], (node.i, node.j)))
+
+
+def cost_tree(grammar, input_string, errors, cost):
+    """Builds the same parse tree as parse_tree from the fewest errors of
+    the entries of a filled table, given by cost(symbol, i, j) or None for
+    an entry that is not there. Each node takes the first split and then
+    the first rule whose costs add up, and nodes are expanded from a stack
+    rather than recursively."""
+    root = Node(1, len(input_string) + 1, None)
+    stack = [(root, grammar.top, errors)]
+    while stack:
+        node, symbol, errors = stack.pop()
+        if node.i == node.j - 1:
+            node.production = leaf_production(grammar, node, symbol, errors,
+                                              input_string)
+            continue
+        found = None
+        for k in range(node.i + 1, node.j):
+            for rule in grammar.lhs_rules[symbol]:
+                l_1 = cost(grammar.rule_left[rule], node.i, k)
+                l_2 = cost(grammar.rule_right[rule], k, node.j)
+                if (l_1 is not None and l_2 is not None and
+                        l_1 + l_2 + grammar.rule_cost[rule] == errors):
+                    found = (k, rule, l_1, l_2)
+                    break
+            if found:
+                break
+        if found is None:
+            raise LookupError((
+                'Could not find match for right hand side of any '
+                'production of {} in table at {}').format(
+                    grammar.symbols[symbol], (node.i, node.j)))
+        k, rule, l_1, l_2 = found
+        node.production = grammar.rule_production[rule]
+        node.left = Node(node.i, k, None)
+        node.right = Node(k, node.j, None)
+        stack.append((node.right, grammar.rule_right[rule], l_2))
+        stack.append((node.left, grammar.rule_left[rule], l_1))
+    return root
@@ -0,0 +1,146 @@
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+from classes import Node, leaf_production, not_found
+
+# Upper bound on the number of float32 values held by one temporary block
+# of span combinations. Starts are processed in chunks so that long inputs
+# do not materialize the whole (pairs, starts, splits) cube at once.
+BLOCK_SIZE = 1 << 22
+
+
+class DenseGrammar(object):
+    """NumPy arrays built from a CompiledGrammar. Distinct right hand sides
+    (B, C) are stored once as pairs and the binary rules are sorted by left
+    hand side so their costs can be reduced per symbol."""
+    def __init__(self, grammar):
+        self.grammar = grammar
+        pairs = {}
+        rule_pair = []
+        for B, C in zip(grammar.rule_left, grammar.rule_right):
+            rule_pair.append(pairs.setdefault((B, C), len(pairs)))
+        self.pair_left = np.array([B for B, _ in pairs], dtype=np.intp)
+        self.pair_right = np.array([C for _, C in pairs], dtype=np.intp)
+        rule_lhs = np.array(grammar.rule_lhs, dtype=np.intp)
+        order = np.argsort(rule_lhs, kind='stable')
+        self.rule_pair = np.array(rule_pair, dtype=np.intp)[order]
+        self.rule_errors = np.array(grammar.rule_cost, dtype=np.intp)
+        self.rule_cost = self.rule_errors[order].astype(np.float32)
+        self.rule_lhs = rule_lhs[order]
+        self.group_start = np.flatnonzero(
+            np.r_[True, self.rule_lhs[1:] != self.rule_lhs[:-1]])
+        self.group_lhs = self.rule_lhs[self.group_start]
+        self.lhs_rules = [np.array(rules, dtype=np.intp)
+                          for rules in grammar.lhs_rules]
+        self.rule_left = np.array(grammar.rule_left, dtype=np.intp)
+        self.rule_right = np.array(grammar.rule_right, dtype=np.intp)
+
+
+class DenseTable(object):
+    """CYK table stored as a dense float32 array indexed [symbol, i, j] where
+    i and j are 0 based span boundaries and infinity means unreachable."""
+    def __init__(self, grammar, input_size):
+        size = input_size + 1
+        self.data = np.full((grammar.size, size, size), np.inf,
+                            dtype=np.float32)
+
+    def diagonal(self, depth):
+        """View of the cells [i, i+depth) for every start i, shaped
+        [symbol, i]."""
+        data = self.data
+        starts = data.shape[1] - depth
+        return as_strided(data[:, :, depth:], shape=(data.shape[0], starts),
+                          strides=(data.strides[0],
+                                   data.strides[1] + data.strides[2]))
+
+
+def fill_span(table, dense, depth, start, stop, limits):
+    """Computes the cells [i, i+depth) for start <= i < stop with min-plus
+    reductions over every split point and pair of right hand side symbols.
+    Costs above the limit of their symbol are left unreachable."""
+    data = table.data
+    count = stop - start
+    strides = data.strides
+    left = as_strided(data[:, start:, start+1:],
+                      shape=(data.shape[0], count, depth-1),
+                      strides=(strides[0], strides[1] + strides[2],
+                               strides[2]))
+    right = as_strided(data[:, start+1:, start+depth:],
+                       shape=(data.shape[0], count, depth-1),
+                       strides=(strides[0], strides[1] + strides[2],
+                                strides[1]))
+    pairs = np.add(left[dense.pair_left], right[dense.pair_right]).min(axis=2)
+    costs = pairs[dense.rule_pair] + dense.rule_cost[:, None]
+    best = np.minimum.reduceat(costs, dense.group_start, axis=0)
+    best[best > limits[dense.group_lhs, None]] = np.inf
+    cells = table.diagonal(depth)[:, start:stop]
+    cells[dense.group_lhs] = np.minimum(cells[dense.group_lhs], best)
+
+
+def dense_parser(grammar, input_string, max_errors=None):
+    """Takes a CompiledGrammar and an input string and returns the same
+    (errors, tree) tuple as error_correcting_parser. Every span length is
+    filled with vectorized min-plus reductions over a dense table, where the
+    cyk engine calls fill_cell on each cell to loop over its splits and
+    rules_by_pair in Python.
+    """
+    input_size = len(input_string)
+    dense = DenseGrammar(grammar)
+    table = DenseTable(grammar, input_size)
+    limits = np.array(grammar.error_limits(max_errors), dtype=np.float32)
+    for i in range(input_size):
+        for A, errors, _ in grammar.terminal_table.get(input_string[i], ()):
+            if errors <= limits[A]:
+                table.data[A, i, i+1] = min(table.data[A, i, i+1], errors)
+    for depth in range(2, input_size + 1 if len(dense.rule_pair) else 2):
+        starts = input_size - depth + 1
+        chunk = max(1, BLOCK_SIZE // (len(dense.pair_left) * (depth - 1)))
+        for start in range(0, starts, chunk):
+            fill_span(table, dense, depth, start, min(starts, start + chunk),
+                      limits)
+    least_err = table.data[grammar.top, 0, input_size]
+    if not np.isfinite(least_err):
+        raise not_found(max_errors)
+    least_err = int(least_err)
+    tree = dense_tree(table, dense, input_string, least_err)
+    return least_err, tree
+
+
+def dense_tree(table, dense, input_string, errors):
+    """Builds the same parse tree as parse_tree from a filled DenseTable.
+    Each node compares all split points and productions of its symbol at
+    once, choosing the first split and then the first production whose cost
+    adds up, and nodes are expanded from a stack rather than recursively."""
+    grammar = dense.grammar
+    data = table.data
+    root = Node(1, len(input_string) + 1, None)
+    stack = [(root, grammar.top, errors)]
+    while stack:
+        node, symbol, errors = stack.pop()
+        i, j = node.i - 1, node.j - 1
+        if i == j - 1:
+            node.production = leaf_production(grammar, node, symbol, errors,
+                                              input_string)
+            continue
+        rules = dense.lhs_rules[symbol]
+        left = data[dense.rule_left[rules], i, i+1:j]
+        right = data[dense.rule_right[rules], i+1:j, j]
+        matches = (left + right + dense.rule_errors[rules, None]) == errors
+        splits = np.flatnonzero(matches.any(axis=0))
+        if not len(splits):
+            raise LookupError((
+                'Could not find match for right hand side of any '
+                'production of {} in table at {}').format(
+                    grammar.symbols[symbol], (node.i, node.j)))
+        split = splits[0]
+        choice = np.argmax(matches[:, split])
+        rule = rules[choice]
+        k = node.i + 1 + split
+        node.production = grammar.rule_production[rule]
+        node.left = Node(node.i, k, None)
+        node.right = Node(k, node.j, None)
+        stack.append((node.right, grammar.rule_right[rule],
+                      int(right[choice, split])))
+        stack.append((node.left, grammar.rule_left[rule],
+                      int(left[choice, split])))
+    return root
@@ -1,109 +1,592 @@
 import argparse
+import collections
+import heapq
+import importlib
+import itertools
+import json
+import os
+import stat
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 
-from classes import Node, Grammar, Lookup, Matrix, BreakIt
+import grammar_cache
+from agenda_parser import agenda_distance
+from classes import (Node, CompiledGrammar, Matrix, OverThreshold, not_found,
+                     UNREACHABLE)
+from parse_stats import ParseStats, load_record
+from recognizer import recognizer
+from result_cache import CACHE_SIZE, ResultCache
+from sequence_io import (FORMATS, ResultWriter, case_normalizer, format_text,
+                         normalize_case, read_records)
 
+# Alternative parsing engines, given as (module, function). They are
+# imported on first use so that their dependencies (NumPy) stay optional.
+ENGINES = {
+    'numpy': ('dense_parser', 'dense_parser'),
+    'valiant': ('valiant_parser', 'valiant_parser'),
+    'agenda': ('agenda_parser', 'agenda_parser'),
+    'wavefront': ('wavefront_parser', 'wavefront_parser'),
+    'lowmem': ('lowmem_parser', 'lowmem_parser'),
+}
+# Engines whose inputs go through the exact Recognizer first. The others
+# fill their tables faster than it, or stop early at a parse without errors.
+PREFILTER_ENGINES = ('cyk', 'lowmem')
+# Number of input lines handed to a worker process at a time in batch mode.
+CHUNK_SIZE = 16
 
-def error_correcting_parser(grammar, input_string):  # pylint: disable=R0914
+# Grammar and engine of a batch worker process, set by init_worker.
+worker_state = {}
+
+
+def load_engine(name):
+    module, function = ENGINES[name]
+    return getattr(importlib.import_module(module), function)
+
+
+def error_correcting_parser(  # pylint: disable=R0912,R0914
+        grammar, input_string, engine='cyk', max_errors=None, stats=None,
+        max_memory=None):
     """Takes a grammar and an input string and returns a tuple of the closest
     string in the grammar for that input string and the distance of the input
-    string to the grammar (number of errors).
+    string to the grammar (number of errors). The grammar may be a Grammar or
+    an already built CompiledGrammar. Any engine other than 'cyk' is looked
+    up in ENGINES and must return the same tuple.
+
+    With max_errors, entries whose cost plus the outside bound of their
+    symbol exceed it are dropped during the fill, and OverThreshold is raised
+    when no correction has at most max_errors errors.
+
+    With a ParseStats, the phases of the parse are marked on it and the
+    counters of the cyk Matrix are added to it.
+
+    With max_memory, a number of bytes, the cyk engine switches to the
+    lowmem engine for inputs whose Matrix would take more than that, and
+    a LookupError is raised for inputs too long for either. Other engines
+    than these two have no memory estimate and ignore it.
     """
+    if not isinstance(grammar, CompiledGrammar):
+        grammar = CompiledGrammar(grammar)
+    if grammar.top is None:
+        raise LookupError('Correction not found. Incomplete input grammar.')
+    if engine in ('cyk', 'lowmem') and max_memory is not None:
+        engine = memory_engine(grammar, engine, len(input_string),
+                               max_errors, max_memory)
+    if engine != 'cyk':
+        result = load_engine(engine)(grammar, input_string,
+                                     max_errors=max_errors)
+        if stats is not None:
+            stats.mark('parse')
+        return result
+    limits = grammar.error_limits(max_errors)
     input_size = len(input_string)
-    list_x = Lookup(grammar.productions, input_size)
-    cyk_matrix = Matrix(input_size)
+    cyk_matrix = Matrix(input_size, grammar.size, grammar.rule_production)
+    last_filled = 0
     for i in range(1, input_size + 1):
         input_char = input_string[i-1:i]
-        for A, productions in grammar.terminals.items():
-            if input_char in productions:
-                errors = productions[input_char].errors
-                cyk_matrix.insert(A, i, i+1, errors, productions[input_char])
-                list_x.insert(A, i, i+1, errors)
+        for A, errors, production in grammar.terminal_table.get(input_char,
+                                                                 ()):
+            if errors <= limits[A]:
+                cyk_matrix.insert(A, i, i+1, errors, production)
+                last_filled = 1
+    if stats is not None:
+        stats.mark('init')
+    rules_by_pair = grammar.pair_rules(limits)
+    if stats is not None:
+        stats.mark('rules')
     for depth in range(2, input_size + 1):
-        for lhs, rhs, production in grammar.get_all(grammar.nonterminals):
-            l_3 = production.errors
-            B, C = rhs.split()
-            for i, k, l_1 in list_x.get_all(B, depth, input_size):
-                j_offset = i + depth
-                cyk_cell = cyk_matrix.get(k, j_offset)
-                if C in cyk_cell:
-                    l_total = l_1 + cyk_cell[C][1] + l_3
-                    cyk_matrix.insert(lhs, i, j_offset, l_total, production)
-                    list_x.insert(lhs, i, j_offset, l_total)
-    least_err = None
-    for (_, k, errors) in list_x.get(Grammar.TOP_SYMBOL, 1).values():
-        if (k == input_size + 1) and (not least_err or errors < least_err):
-            least_err = errors
-    if least_err is None:
-        raise LookupError('Correction not found. Incomplete input grammar.')
-    tree = parse_tree(cyk_matrix, Grammar.TOP_SYMBOL, 1, input_size + 1,
-                      least_err, grammar.nonterminals)
+        # A span is only filled from two shorter filled spans, so once every
+        # length from last_filled + 1 up to twice that is empty, so are all
+        # the longer ones.
+        if depth > 2 * last_filled:
+            break
+        for i in range(1, input_size - depth + 2):
+            if fill_cell(cyk_matrix, rules_by_pair, i, i + depth):
+                last_filled = depth
+        if stats is not None:
+            stats.end_depth(cyk_matrix)
+    if stats is not None:
+        stats.mark('fill')
+        stats.add_matrix(cyk_matrix)
+    least_err = cyk_matrix.backpointer(grammar.top, 1, input_size + 1)[0]
+    if least_err == UNREACHABLE:
+        raise not_found(max_errors)
+    tree = parse_tree(cyk_matrix, grammar.top, 1, input_size + 1,
+                      least_err, grammar)
+    if stats is not None:
+        stats.mark('tree')
     return least_err, tree
 
 
-def parse_tree(cyk_matrix, current_symbol, i, j, errors, nonterminals):
+def memory_engine(grammar, engine, input_size, max_errors, max_memory):
+    """Returns the engine whose table for an input of input_size characters
+    fits in max_memory bytes: 'cyk' if that is the engine asked for and its
+    Matrix does, and else 'lowmem'."""
+    from lowmem_parser import CompactTable, matrix_estimate
+    if (engine == 'cyk' and
+            matrix_estimate(input_size, grammar.size) <= max_memory):
+        return 'cyk'
+    needed = CompactTable.estimate(input_size, grammar.size, max_errors)
+    if needed > max_memory:
+        raise LookupError(
+            'Input of {} characters needs about {} MB, more than the memory '
+            'limit of {} MB.'.format(input_size, -(-needed >> 20),
+                                     max_memory >> 20))
+    return 'lowmem'
+
+
+def fill_cell(cyk_matrix, rules_by_pair, i, j):
+    """Fills the cell (i, j) of a Matrix made with the rules of the grammar
+    from every split into (i, k) and (k, j), and returns whether any entry
+    was stored. Only the symbols that the two halves hold are visited: each
+    B of (i, k) is matched against its rules or the symbols of (k, j),
+    whichever is shorter. Splits are tried in increasing order and an equal
+    cost only replaces an entry of the same split with a lower rule, so each
+    entry records the first split and rule that reach its cost. Entries
+    above the limit of their rule's left hand side are dropped. The counters
+    of the Matrix are updated as Matrix.insert would."""
+    costs, entries = cyk_matrix.costs, cyk_matrix.entries
+    width = cyk_matrix.width
+    best, cell = costs[i-1], (j-i-1) * width
+    splits, choices = cyk_matrix.splits[i-1], cyk_matrix.choices[i-1]
+    symbols = entries[i-1][j-i-1]
+    visited = combined = tried = improved = 0
+    for k in range(i + 1, j):
+        right_symbols = entries[k-1][j-k-1]
+        if not right_symbols:
+            continue
+        left_symbols = entries[i-1][k-i-1]
+        visited += len(left_symbols)
+        left_base = (k-i-1) * width
+        right, right_base = costs[k-1], (j-k-1) * width
+        for B in left_symbols:
+            pairs = rules_by_pair.get(B)
+            if pairs is None:
+                continue
+            l_1 = best[left_base + B]
+            if len(pairs) <= len(right_symbols):
+                visited += len(pairs)
+                pairs = pairs.items()
+            else:
+                visited += len(right_symbols)
+                pairs = [(C, pairs[C]) for C in right_symbols if C in pairs]
+            for C, rules in pairs:
+                l_2 = right[right_base + C]
+                if l_2 == UNREACHABLE:
+                    continue
+                combined += 1
+                tried += len(rules)
+                for lhs, l_3, rule, limit in rules:
+                    l_total = l_1 + l_2 + l_3
+                    index = cell + lhs
+                    if l_total > limit or l_total > best[index]:
+                        continue
+                    if l_total < best[index] or (
+                            splits[index] == k and rule < choices[index]):
+                        if best[index] == UNREACHABLE:
+                            symbols.append(lhs)
+                        best[index] = l_total
+                        choices[index] = rule
+                        splits[index] = k
+                        improved += 1
+    cyk_matrix.visited += visited
+    cyk_matrix.combined += combined
+    cyk_matrix.tried += tried
+    cyk_matrix.improved += improved
+    return improved > 0
+
+
+class IncrementalParser(object):
+    """Error correcting parser that reads its input one character at a time.
+    Every character adds the column of cells that end after it to the CYK
+    Matrix, so the distance and correction of the prefix read so
+    far are available at any point without parsing it again."""
+    def __init__(self, grammar):
+        if not isinstance(grammar, CompiledGrammar):
+            grammar = CompiledGrammar(grammar)
+        if grammar.top is None:
+            raise LookupError(
+                'Correction not found. Incomplete input grammar.')
+        self.grammar = grammar
+        self.chars = []
+        self.cyk_matrix = Matrix(0, grammar.size, grammar.rule_production)
+        self.rules_by_pair = grammar.pair_rules(
+            [float('inf')] * grammar.size)
+
+    @property
+    def input_string(self):
+        return "".join(self.chars)
+
+    def push(self, input_char):
+        """Adds a character to the input and returns the distance of the
+        input read so far to the grammar (None when it has no parse)."""
+        cyk_matrix = self.cyk_matrix
+        self.chars.append(input_char)
+        cyk_matrix.add_column()
+        j = len(self.chars) + 1
+        for A, errors, production in self.grammar.terminal_table.get(
+                input_char, ()):
+            cyk_matrix.insert(A, j-1, j, errors, production)
+        for i in range(j - 2, 0, -1):
+            fill_cell(cyk_matrix, self.rules_by_pair, i, j)
+        return self.distance()
+
+    def extend(self, input_string):
+        for input_char in input_string:
+            self.push(input_char)
+        return self.distance()
+
+    def distance(self):
+        if not self.chars:
+            return None
+        tup = self.cyk_matrix.get(1, len(self.chars) + 1).get(
+            self.grammar.top)
+        return None if tup is None else tup[1]
+
+    def correction(self):
+        """Returns the same (errors, tree) tuple as error_correcting_parser
+        for the input read so far."""
+        least_err = self.distance()
+        if least_err is None:
+            raise LookupError(
+                'Correction not found. Incomplete input grammar.')
+        tree = parse_tree(self.cyk_matrix, self.grammar.top, 1,
+                          len(self.chars) + 1, least_err, self.grammar)
+        return least_err, tree
+
+
+def parse_tree(cyk_matrix, current_symbol, i, j, errors, grammar):
     """Takes a Matrix, a symbol, a start location, an end location, the best
-    error distance for the string, and a list of nonterminals and returns a
+    error distance for the string, and the CompiledGrammar and returns a
     parse tree for the individual characters in the string. This can be used
-    to find I'.
+    to find I'. The tree follows the production and split recorded with
+    each entry during the fill, one node at a time from a stack.
     """
-    if i == j - 1:
-        tups = cyk_matrix.get(i, j)
-        if current_symbol in tups:
-            tup = tups[current_symbol]
-            if tup[1] == errors:
-                return Node(i, j, tup[2])
-        raise LookupError('Could not find {} in cyk_matrix at {}'.format(
-            current_symbol, (i, j)))
-    A, B, q_1, q_2, dab, k = [None] * 6
-    try:
-        for k in range(i+1, j):
-            for rhs, dab in nonterminals[current_symbol].items():
-                A, B = rhs.split()
-                if A in cyk_matrix.get(i, k) and B in cyk_matrix.get(k, j):
-                    q_1 = cyk_matrix.get(i, k)[A][1]
-                    q_2 = cyk_matrix.get(k, j)[B][1]
-                    if dab.errors + q_1 + q_2 == errors:
-                        raise BreakIt
-        raise LookupError((
-            'Could not find match for right hand side of any '
-            'production of {} in cyk_matrix at {}').format(
-                current_symbol, (i, j)))
-    except BreakIt:
-        pass
-    left = parse_tree(cyk_matrix, A, i, k, q_1, nonterminals)
-    right = parse_tree(cyk_matrix, B, k, j, q_2, nonterminals)
-    root = Node(i, j, dab)
-    root.left = left
-    root.right = right
+    rules = len(grammar.rule_production)
+    root = Node(i, j, None)
+    stack = [(root, current_symbol, errors)]
+    while stack:
+        node, symbol, errors = stack.pop()
+        cost, choice, k = cyk_matrix.backpointer(symbol, node.i, node.j)
+        if cost != errors:
+            raise LookupError('Could not find {} in cyk_matrix at {}'.format(
+                grammar.symbols[symbol], (node.i, node.j)))
+        node.production = cyk_matrix.productions[choice]
+        if node.i == node.j - 1:
+            continue
+        if choice >= rules:
+            raise LookupError((
+                'Could not find match for right hand side of any '
+                'production of {} in cyk_matrix at {}').format(
+                    grammar.symbols[symbol], (node.i, node.j)))
+        left, right = grammar.rule_left[choice], grammar.rule_right[choice]
+        node.left = Node(node.i, k, None)
+        node.right = Node(k, node.j, None)
+        stack.append((node.right, right,
+                      cyk_matrix.backpointer(right, k, node.j)[0]))
+        stack.append((node.left, left,
+                      cyk_matrix.backpointer(left, node.i, k)[0]))
     return root
 
 
 def correct_string(node):
     """Corrects the given tree by replacing all error productions with their
     corresponding corrections"""
-    production = node.production
-    if production.is_T():
-        if production.inserted:
-            res = ""
-        elif production.replaced != "":
-            res = production.replaced
+    pieces = []
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, str):
+            pieces.append(node)
+            continue
+        production = node.production
+        pieces.append(production.prefix)
+        stack.append(production.suffix)
+        if production.is_T():
+            if production.inserted:
+                stack.append("")
+            elif production.replaced != "":
+                stack.append(production.replaced)
+            else:
+                stack.append(production.rhs)
         else:
-            res = production.rhs
+            stack.append(node.right)
+            stack.append(node.left)
+    return "".join(pieces)
+
+
+def load_grammar(lines, grammar_path=None):
+    """Takes the lines of a covering grammar file and returns its
+    CompiledGrammar. When the path of the file is given the compiled grammar
+    is read from, or written to, its binary cache."""
+    return grammar_cache.load_compiled(lines, grammar_path)
+
+
+def find_correction(grammar, input_string, engine='cyk', max_errors=None,
+                    cache=None, stats=None, max_memory=None):
+    """Takes a CompiledGrammar and an input string and returns the number of
+    errors and the closest string in the grammar, or None when it has more
+    than max_errors errors. With the engines of PREFILTER_ENGINES, strings
+    that are already in the grammar are found by the exact Recognizer, and
+    only the others go through the error correcting parser. With a
+    ResultCache, a cached result is returned without parsing and new ones
+    are added to it. With a ParseStats, the phases are marked on it and its
+    fields tell the input size, the errors and whether the result was found
+    in the cache, by the recognizer or by the parser. max_memory is passed
+    on to error_correcting_parser. An empty input raises LookupError.
+    """
+    if not input_string:
+        raise LookupError("Empty input")
+    if stats is not None:
+        stats.fields['n'] = len(input_string)
+    if cache is not None:
+        result = cache.get(grammar, input_string)
+        if stats is not None:
+            stats.mark('cache')
+        if result is not None:
+            if stats is not None:
+                stats.fields.update(errors=result[0], found_by='cache')
+            if max_errors is not None and result[0] > max_errors:
+                return None
+            return result
+    exact = False
+    if engine in PREFILTER_ENGINES:
+        exact = recognizer(grammar).accepts(input_string)
+        if stats is not None:
+            stats.mark('recognize')
+    if exact:
+        result = (0, input_string)
+        found_by = 'recognizer'
     else:
-        res = correct_string(node.left) + correct_string(node.right)
-    return production.prefix + res + production.suffix
+        found_by = 'parser'
+        try:
+            errors, tree = error_correcting_parser(grammar, input_string,
+                                                   engine, max_errors, stats,
+                                                   max_memory)
+        except OverThreshold:
+            if stats is not None:
+                stats.fields.update(errors=None, found_by=found_by)
+            return None
+        result = (errors, correct_string(tree))
+        if stats is not None:
+            stats.mark('correct')
+    if stats is not None:
+        stats.fields.update(errors=result[0], found_by=found_by)
+    if cache is not None:
+        cache.put(grammar, input_string, result)
+    return result
+
 
+def format_result(grammar, input_string, engine='cyk', max_errors=None,
+                  cache=None, stats=None):
+    """Takes a grammar and an input string, runs the parser and returns the
+    Input string, the closest string in the grammar (I') and the number of
+    errors between them as printed by run_parser.
+    """
+    if not isinstance(grammar, CompiledGrammar):
+        grammar = CompiledGrammar(grammar)
+    result = find_correction(grammar, input_string, engine, max_errors, cache,
+                             stats)
+    return format_text(input_string, result, max_errors)
 
-def run_parser(grammar, input_string):
+
+def run_parser(grammar, input_string, engine='cyk', max_errors=None,
+               cache=None, stats_output=None):
     """Takes a grammar and an input string and runs the parser. This function
     prints out the Input string, the closest string in the grammar (I') and
-    the number of errors between them
+    the number of errors between them. With stats_output, the ParseStats
+    record of the parse is written to it as a JSON line.
     """
-    errors, tree = error_correcting_parser(grammar, input_string)
-    corrected_string = correct_string(tree)
-    print("I : %s" % input_string)
-    print("I': %s" % corrected_string)
-    print("E : %d" % errors)
+    stats = ParseStats() if stats_output is not None else None
+    print(format_result(grammar, input_string, engine, max_errors, cache,
+                        stats))
+    if stats is not None:
+        write_stats(stats_output, stats.record())
+
+
+def write_stats(output, record):
+    output.write(json.dumps(record) + "\n")
+    output.flush()
+
+
+def try_correction(grammar, input_string, **options):
+    """Returns the result of find_correction, or the LookupError it raised
+    for an input that cannot be parsed, such as one too long for max_memory,
+    so that the error is reported with its input."""
+    try:
+        return find_correction(grammar, input_string, **options)
+    except LookupError as error:
+        return error
+
+
+def run_serial(grammar, input_strings, cache=None, stats_output=None,
+               wait=None, **options):
+    """Yields the try_correction result of every input string in turn, as
+    run_batch does with worker processes. With stats_output, the ParseStats
+    record of each input is written to it as a JSON line. wait, when given,
+    is called before each parse, e.g. to flush the results so far."""
+    for input_string in input_strings:
+        if wait is not None:
+            wait()
+        stats = ParseStats() if stats_output is not None else None
+        result = try_correction(grammar, input_string, cache=cache,
+                                stats=stats, **options)
+        if stats is not None:
+            write_stats(stats_output, stats.record())
+        yield result
+
+
+def run_stream(grammar, stream, output):
+    """Feeds the characters of a stream to an IncrementalParser, writing the
+    position and current distance after each one ('-' while the prefix has
+    no parse), followed by the output of run_parser for the whole input.
+    Whitespace is skipped, and the characters are put in the case of the
+    terminals of the grammar as normalize_case does."""
+    incremental = IncrementalParser(grammar)
+    normalize = case_normalizer(grammar)
+    for input_char in iter(lambda: stream.read(1), ''):
+        if input_char.isspace():
+            continue
+        if normalize is not None:
+            input_char = normalize(input_char)
+        errors = incremental.push(input_char)
+        output.write("%d\t%s\n" % (len(incremental.chars),
+                                    '-' if errors is None else errors))
+        output.flush()
+    if not incremental.chars:
+        result = LookupError("Empty input")
+    else:
+        try:
+            errors, tree = incremental.correction()
+            result = (errors, correct_string(tree))
+        except LookupError as error:
+            result = error
+    output.write(format_text(incremental.input_string, result) + "\n")
+
+
+def run_scan(grammar, sequences, width, max_errors, maximal, output):
+    """Scans (name, sequence) pairs for substrings within max_errors of the
+    grammar and writes one tab separated line per match with the name, the
+    1 based first and last position, the errors and the substring. Every
+    window of width symbols is reported, or with maximal every substring of
+    at most width symbols that is not part of a longer match."""
+    from scan_parser import scan_windows, scan_maximal
+    scan = scan_maximal if maximal else scan_windows
+    for name, sequence in sequences:
+        for start, end, errors in scan(grammar, sequence, width, max_errors):
+            output.write("%s\t%d\t%d\t%d\t%s\n" % (
+                name, start + 1, end, errors, sequence[start:end]))
+        output.flush()
+
+
+def error_distance(grammar, input_string, max_errors=None):
+    """Returns the distance of input_string to the grammar, or None when it
+    has no correction with at most max_errors errors. No productions are
+    kept and no tree is built: members of the grammar are found by the
+    Recognizer and the others by a best-first search that stops at the
+    first parse of the whole input."""
+    if recognizer(grammar).accepts(input_string):
+        return 0
+    try:
+        return agenda_distance(grammar, input_string, max_errors)
+    except LookupError:
+        return None
+
+
+def run_rank(grammar, sequences, count, max_errors, output):
+    """Writes the count (name, sequence) pairs closest to the grammar as tab
+    separated lines with the name, the errors and the sequence, closest
+    first and in input order between equal distances. Once count sequences
+    are kept, a later one only matters when it is closer than the farthest
+    of them, so it is searched with one error less than that as its bound
+    and left as soon as it cannot get there."""
+    kept = []
+    for order, (name, sequence) in enumerate(sequences):
+        cutoff = max_errors
+        if len(kept) == count:
+            cutoff = -kept[0][0] - 1
+            if max_errors is not None:
+                cutoff = min(cutoff, max_errors)
+            if cutoff < 0:
+                continue
+        errors = error_distance(grammar, sequence, cutoff)
+        if errors is None:
+            continue
+        entry = (-errors, -order, name, sequence)
+        if len(kept) < count:
+            heapq.heappush(kept, entry)
+        else:
+            heapq.heapreplace(kept, entry)
+    for errors, _, name, sequence in sorted(kept, reverse=True):
+        output.write("%s\t%d\t%s\n" % (name, -errors, sequence))
+    output.flush()
+
+
+def init_worker(grammar_lines, grammar_path, options, cache_options=None,
+                stats=False):
+    worker_state['grammar'] = load_grammar(grammar_lines, grammar_path)
+    worker_state['options'] = options
+    worker_state['cache'] = (ResultCache(*cache_options)
+                             if cache_options is not None else None)
+    worker_state['stats'] = stats
+
+
+def parse_chunk(input_strings):
+    """Returns the try_correction results of the input strings, the stats
+    of the worker's ResultCache since the last chunk (None without one) and
+    the ParseStats records of the inputs (None unless the worker keeps
+    them)."""
+    cache = worker_state['cache']
+    results = []
+    records = [] if worker_state['stats'] else None
+    for input_string in input_strings:
+        stats = ParseStats() if records is not None else None
+        results.append(try_correction(worker_state['grammar'], input_string,
+                                      cache=cache, stats=stats,
+                                      **worker_state['options']))
+        if stats is not None:
+            records.append(stats.record())
+    return (results, cache.take_stats() if cache is not None else None,
+            records)
+
+
+def run_batch(grammar_lines, input_strings, jobs=1, chunk_size=CHUNK_SIZE,
+              grammar_path=None, cache=None, stats_output=None, wait=None,
+              **options):
+    """Parses the input strings over a pool of jobs worker processes, each of
+    which loads the grammar once, and yields the results of try_correction
+    in input order. The options are passed on to find_correction. Input is read
+    and handed out in chunks, with at most two chunks per worker in flight,
+    so memory stays bounded on large files. With a ResultCache every worker
+    keeps one of the same size and store, and their stats are added to it.
+    With stats_output, the ParseStats records of the inputs are written to
+    it as JSON lines in input order. wait, when given, is called before
+    waiting for a chunk that is not done yet, e.g. to flush the results so
+    far.
+    """
+    input_strings = iter(input_strings)
+    cache_options = None if cache is None else (cache.size, cache.path)
+    with ProcessPoolExecutor(jobs, initializer=init_worker,
+                             initargs=(grammar_lines, grammar_path,
+                                       options, cache_options,
+                                       stats_output is not None)) as executor:
+        pending = collections.deque()
+        while True:
+            chunk = list(itertools.islice(input_strings, chunk_size))
+            if chunk:
+                pending.append(executor.submit(parse_chunk, chunk))
+            if pending and (not chunk or len(pending) >= 2 * jobs):
+                if wait is not None and not pending[0].done():
+                    wait()
+                results, stats, records = pending.popleft().result()
+                if stats is not None:
+                    cache.add_stats(stats)
+                for record in records or ():
+                    write_stats(stats_output, record)
+                for result in results:
+                    yield result
+            elif not chunk:
+                break
 
 
 def main():
@@ -111,21 +594,128 @@ def main():
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument('-s', '--string', help="string to test")
     group.add_argument('-i', '--infile',
-                       type=argparse.FileType('r'),
-                       help="file of strings to be tested")
+                       help="file of strings to be tested, one per line or "
+                       "as FASTA or FASTQ records, optionally gzipped (- "
+                       "for stdin)")
+    group.add_argument('-t', '--stream', action='store_true',
+                       help="read one string from stdin as a stream and "
+                       "report the distance after every character")
     parser.add_argument('-g', '--grammar_file', default='grammar.txt',
                         type=argparse.FileType('r'),
                         help="grammar file of rule to use")
+    parser.add_argument('-e', '--engine', default='cyk',
+                        choices=['cyk'] + sorted(ENGINES),
+                        help="parsing engine to use")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="number of worker processes for -i")
+    parser.add_argument('-k', '--max-errors', type=int,
+                        help="only look for corrections with at most this "
+                        "many errors")
+    parser.add_argument('-w', '--scan', type=int, metavar='WIDTH',
+                        help="scan -s or the sequences of -i (plain or "
+                        "FASTA) for windows of WIDTH symbols within -k "
+                        "errors")
+    parser.add_argument('--maximal', action='store_true',
+                        help="with --scan, report the maximal substrings of "
+                        "at most WIDTH symbols instead of the windows")
+    parser.add_argument('--rank', type=int, metavar='K',
+                        help="only report the K strings of -s or -i (plain "
+                        "or FASTA) closest to the grammar, with their "
+                        "distances")
+    parser.add_argument('--results', metavar='PATH',
+                        help="SQLite file to keep the results of -s and -i "
+                        "in across runs")
+    parser.add_argument('--results-size', type=int, default=CACHE_SIZE,
+                        metavar='N', help="number of results of -s and -i "
+                        "kept in memory")
+    parser.add_argument('--results-stats', action='store_true',
+                        help="print the hits of the result cache to stderr")
+    parser.add_argument('--stats', action='store_true',
+                        help="write the phase timings and work counters of "
+                        "every parse of -s or -i to stderr as JSON lines")
+    parser.add_argument('-m', '--max-memory', type=int, metavar='MB',
+                        help="keep the table of the cyk or lowmem engine "
+                        "under MB megabytes, the cyk engine switching to "
+                        "the lowmem engine for long inputs")
+    parser.add_argument('-f', '--format', default='text', choices=FORMATS,
+                        help="output format of the results of -s and -i")
+    parser.add_argument('--no_cache', action='store_true',
+                        help="do not read or write the binary grammar cache")
     args = parser.parse_args()
+    if args.infile is not None and args.infile != '-':
+        # Pipes are only looked up, as opening one waits for its writer.
+        try:
+            if not stat.S_ISFIFO(os.stat(args.infile).st_mode):
+                open(args.infile, 'rb').close()
+        except OSError as error:
+            parser.error("argument -i/--infile: can't open '%s': %s" %
+                         (args.infile, error))
+    if args.max_errors is not None and args.max_errors < 0:
+        parser.error("-k/--max-errors must be a non negative integer")
+    if args.scan is not None and (args.scan < 1 or args.max_errors is None
+                                  or args.stream):
+        parser.error("--scan needs WIDTH >= 1, -k and one of -s or -i")
+    if args.rank is not None and (args.rank < 1 or args.stream or
+                                  args.scan is not None):
+        parser.error("--rank needs K >= 1 and one of -s or -i, without "
+                     "--scan")
+    if args.stats and (args.stream or args.scan is not None or
+                       args.rank is not None):
+        parser.error("--stats needs one of -s or -i, without --scan or "
+                     "--rank")
+    if args.max_memory is not None and args.engine not in ('cyk', 'lowmem'):
+        parser.error("-m/--max-memory needs the cyk or lowmem engine")
+    if args.engine == 'wavefront' and args.jobs > 1:
+        parser.error("-e wavefront runs its own worker processes and cannot "
+                     "be combined with -j")
+    stats_output = sys.stderr if args.stats else None
 
-    grammar = Grammar()
-    for line in args.grammar_file:
-        grammar.add_production(line)
-    if args.string:
-        run_parser(grammar, args.string)
-    if args.infile:
-        for line in args.infile:
-            run_parser(grammar, line.strip())
+    grammar_lines = args.grammar_file.readlines()
+    grammar_path = None
+    if not args.no_cache and os.path.isfile(args.grammar_file.name):
+        grammar_path = args.grammar_file.name
+    start = time.perf_counter()
+    grammar = load_grammar(grammar_lines, grammar_path)
+    if stats_output is not None:
+        write_stats(stats_output,
+                    load_record(grammar, time.perf_counter() - start))
+    if args.string is not None:
+        sequences = normalize_case([('1', args.string)], grammar)
+    elif args.infile is not None:
+        sequences = normalize_case(read_records(args.infile), grammar)
+    if args.scan is not None:
+        run_scan(grammar, sequences, args.scan, args.max_errors,
+                 args.maximal, sys.stdout)
+        return
+    if args.rank is not None:
+        run_rank(grammar, sequences, args.rank, args.max_errors, sys.stdout)
+        return
+    if args.stream:
+        run_stream(grammar, sys.stdin, sys.stdout)
+        return
+    cache = ResultCache(args.results_size, args.results)
+    options = {'engine': args.engine, 'max_errors': args.max_errors}
+    if args.max_memory is not None:
+        options['max_memory'] = args.max_memory << 20
+    sequences, copies = itertools.tee(sequences)
+    input_strings = (sequence for _, sequence in copies)
+    writer = ResultWriter(sys.stdout, args.format, args.max_errors)
+    if args.jobs > 1:
+        results = run_batch(grammar_lines, input_strings, args.jobs,
+                            grammar_path=grammar_path, cache=cache,
+                            stats_output=stats_output, wait=writer.flush,
+                            **options)
+    else:
+        results = run_serial(grammar, input_strings, cache, stats_output,
+                             wait=writer.flush, **options)
+    for (name, sequence), result in zip(sequences, results):
+        writer.write(name, sequence, result)
+    writer.flush()
+    cache.close()
+    if args.results_stats:
+        print("results: {hits} hits, {disk_hits} disk hits, {misses} misses, "
+              "hit rate {hit_rate:.3f}".format(**cache.stats()),
+              file=sys.stderr)
 
 if __name__ == '__main__':
     main()
@@ -1,6 +1,9 @@
 import argparse
 import copy
+import heapq
+import re
 
+import grammar_cache
 from classes import Production, Grammar as BaseGrammar
 
 
@@ -47,26 +50,48 @@ class Grammar(BaseGrammar):
                 self.nullable.pop(production.lhs)
 
     def try_add(self, new_production):
+        """Adds new_production unless a production with the same sides and
+        at most as many errors exists, and returns whether it was added. A
+        replaced production moves to the end of productions and terminals
+        or nonterminals but keeps its place in the other groups."""
         lhs, rhs, errors = new_production.to_tuple()
-        if lhs in self.productions:
-            if rhs in self.productions[lhs]:
-                if errors < self.productions[lhs][rhs].errors:
-                    self.productions[lhs].pop(rhs)
-                else:
-                    return False
-                if new_production.is_T():
-                    if errors < self.terminals[lhs][rhs].errors:
-                        self.terminals[lhs].pop(rhs)
-                else:
-                    if errors < self.nonterminals[lhs][rhs].errors:
-                        self.nonterminals[lhs].pop(rhs)
+        productions = self.productions.get(lhs)
+        if productions is not None and rhs in productions:
+            if errors >= productions[rhs].errors:
+                return False
+            del productions[rhs]
+            if new_production.is_T():
+                del self.terminals[lhs][rhs]
+            else:
+                del self.nonterminals[lhs][rhs]
         self.add_production(new_production)
         return True
 
+    def copy(self):
+        """Returns a copy of the grammar with its own Production objects and
+        every group in the same order."""
+        copies = {}
+
+        def copy_production(production):
+            if id(production) not in copies:
+                copies[id(production)] = copy.copy(production)
+            return copies[id(production)]
+
+        grammar = Grammar()
+        for name in ('productions', 'terminals', 'nonterminals',
+                     'nonterminal_units', 'nonterminal_nonunits'):
+            setattr(grammar, name, {
+                lhs: {rhs: copy_production(production)
+                      for rhs, production in group.items()}
+                for lhs, group in getattr(self, name).items()})
+        grammar.nullable = {lhs: copy_production(production)
+                            for lhs, production in self.nullable.items()}
+        grammar.chars = dict(self.chars)
+        return grammar
+
 
 def construct_covering(grammar):
-    grammar_p = Grammar()
-    grammar_p = copy.deepcopy(grammar)
+    grammar_p = grammar.copy()
     grammar_p.add_production(
         '{0} -> {0} {1}'.format(Production.H_SYM, Production.I_SYM))
     grammar_p.add_production(
@@ -94,8 +119,9 @@ def construct_covering(grammar):
 
 
 def eliminate_epsilon_productions(grammar):
-    for symbol in grammar.productions:
-        add_nullable(grammar, symbol)
+    for symbol, (errors, deleted) in nullable_costs(grammar).items():
+        grammar.try_add(Production(
+            symbol, errors, Production.EPSILON).set_deleted(deleted))
     convert_nullable(grammar)
     for production in list(grammar.nullable.values()):
         grammar.remove_production(production)
@@ -103,125 +129,334 @@ def eliminate_epsilon_productions(grammar):
 
 
 def convert_nullable(grammar):
+    nullable = grammar.nullable
     for lhs, rhs, nonterminal in grammar.get_all(grammar.nonterminal_nonunits):
         rhs_b, rhs_c = rhs.split()
-        if rhs_b in grammar.nullable:
+        if rhs_b in nullable:
             grammar.try_add(Production(
-                '{} ->{} {}'.format(
-                    lhs,
-                    nonterminal.errors +
-                    grammar.nullable[rhs_b].errors,
-                    rhs_c)
-                ).set_prefix(grammar.nullable[rhs_b].deleted))
-        if rhs_c in grammar.nullable:
+                lhs, nonterminal.errors + nullable[rhs_b].errors, rhs_c
+            ).set_prefix(nullable[rhs_b].deleted))
+        if rhs_c in nullable:
             grammar.try_add(Production(
-                '{} ->{} {}'.format(
-                    lhs,
-                    nonterminal.errors +
-                    grammar.nullable[rhs_c].errors,
-                    rhs_b)
-                ).set_suffix(grammar.nullable[rhs_c].deleted))
-
-
-def add_nullable(grammar, symbol):
-    if symbol in grammar.productions:
-        for production in list(grammar.productions[symbol].values()):
-            if production.exclude_nullable:
+                lhs, nonterminal.errors + nullable[rhs_c].errors, rhs_b
+            ).set_suffix(nullable[rhs_c].deleted))
+
+
+def nullable_costs(grammar):
+    """Returns {symbol: (errors, deleted)} with the fewest errors of deriving
+    the empty string from every nullable symbol and the characters it
+    deletes. The errors of a production are those of its nullable right
+    hand side symbols. This is a worklist fixed point in the manner of
+    Knuth's generalization of Dijkstra's algorithm: symbols are settled in
+    order of errors, and a production is tried once every symbol on its
+    right hand side is settled. Between equal costs the first production of
+    a symbol is used."""
+    best = {}
+    uses = {}
+    waiting = {}
+    for lhs, productions in grammar.productions.items():
+        for index, production in enumerate(productions.values()):
+            if production.rhs == Production.EPSILON:
+                key = (production.errors, index)
+                if lhs not in best or key < best[lhs][:2]:
+                    best[lhs] = key + (production.deleted,)
                 continue
-            production.exclude_nullable = True
-            if not production.is_Unit():
-                rhs_b, rhs_c = production.rhs.split()
-                if rhs_b == symbol or rhs_c == symbol:
-                    continue
-                if (rhs_b not in grammar.nullable and
-                        not add_nullable(grammar, rhs_b)):
-                    return False
-                if (rhs_c not in grammar.nullable and
-                        not add_nullable(grammar, rhs_c)):
-                    return False
-                sum_null = grammar.nullable[rhs_b].errors +\
-                    grammar.nullable[rhs_c].errors
-                if grammar.try_add(
-                        Production(
-                            '{0} ->{1} {2}'.format(
-                                symbol, sum_null, Production.EPSILON)
-                        ).set_deleted(
-                            grammar.nullable[rhs_b].deleted +
-                            grammar.nullable[rhs_c].deleted
-                        )):
-                    return True
-            else:
-                rhs_b = production.rhs
-                if (rhs_b not in grammar.nullable and
-                        not add_nullable(grammar, rhs_b)):
-                    return False
-                prod_rhs = grammar.nullable[rhs_b]
-                if grammar.try_add(
-                        Production(
-                            '{0} ->{1} {2}'.format(
-                                symbol, prod_rhs.errors, Production.EPSILON)
-                        ).set_deleted(prod_rhs.deleted)):
-                    return True
-    return False
+            if production.is_T():
+                continue
+            rhs = production.rhs.split()
+            if len(rhs) == 2 and lhs in rhs:
+                continue
+            waiting[lhs, index] = len(set(rhs))
+            for symbol in set(rhs):
+                uses.setdefault(symbol, []).append((lhs, index, rhs))
+    heap = [(errors, order, lhs)
+            for order, (lhs, (errors, _, _)) in enumerate(best.items())]
+    heapq.heapify(heap)
+    order = len(heap)
+    settled = {}
+    while heap:
+        errors, _, symbol = heapq.heappop(heap)
+        if symbol in settled or errors != best[symbol][0]:
+            continue
+        settled[symbol] = (errors, best[symbol][2])
+        for lhs, index, rhs in uses.get(symbol, ()):
+            waiting[lhs, index] -= 1
+            if waiting[lhs, index] or lhs in settled:
+                continue
+            key = (sum(settled[part][0] for part in rhs), index)
+            if lhs not in best or key < best[lhs][:2]:
+                best[lhs] = key + ("".join(settled[part][1]
+                                           for part in rhs),)
+                heapq.heappush(heap, (key[0], order, lhs))
+                order += 1
+    return settled
 
 
 def eliminate_unit_productions(grammar):
-    nt_units = copy.deepcopy(grammar.nonterminal_units)
-    for lhs, _, prod in grammar.get_all(nt_units):
-        convert_units(grammar, nt_units, lhs, prod)
+    nt_units = {lhs: dict(units)
+                for lhs, units in grammar.nonterminal_units.items()}
+    for sym_top, units in nt_units.items():
+        if units:
+            convert_units(grammar, nt_units, sym_top)
     for _, _, production in list(grammar.get_all(grammar.nonterminal_units)):
         grammar.remove_production(production)
 
 
-def convert_units(grammar, nt_units, sym_top, current_prod):
-    if current_prod.rhs in grammar.productions:
-        for production in list(grammar.productions[current_prod.rhs].values()):
-            grammar.try_add(
-                Production(
-                    '{0} ->{1} {2}'.format(
-                        sym_top,
-                        current_prod.errors + production.errors,
-                        production.rhs)
+def unit_distances(nt_units, sym_top):
+    """Returns the fewest errors of a chain of unit productions from sym_top
+    to every symbol it reaches, by Dijkstra's algorithm."""
+    distances = {sym_top: 0}
+    heap = [(0, sym_top)]
+    while heap:
+        errors, symbol = heapq.heappop(heap)
+        if errors > distances[symbol]:
+            continue
+        for rhs, production in nt_units.get(symbol, {}).items():
+            total = errors + production.errors
+            if rhs not in distances or total < distances[rhs]:
+                distances[rhs] = total
+                heapq.heappush(heap, (total, rhs))
+    return distances
+
+
+def convert_units(grammar, nt_units, sym_top):
+    """Gives sym_top a copy of every production of each symbol it reaches
+    through unit productions, with the errors of the cheapest chain added.
+    The chains are walked depth first over the unit productions that lie on
+    a cheapest chain, visiting each symbol once, so among equally cheap
+    chains the first in the order of the unit productions is used."""
+    distances = unit_distances(nt_units, sym_top)
+    visited = {sym_top}
+    stack = [(0, "", "", iter(nt_units[sym_top].items()))]
+    while stack:
+        errors, prefix, suffix, children = stack[-1]
+        for rhs, unit in children:
+            total = errors + unit.errors
+            if rhs in visited or total != distances[rhs]:
+                continue
+            visited.add(rhs)
+            chain_prefix = prefix + unit.prefix
+            chain_suffix = unit.suffix + suffix
+            current = grammar.productions[sym_top]
+            for production in grammar.productions.get(rhs, {}).values():
+                existing = current.get(production.rhs)
+                if (existing is not None and
+                        existing.errors <= total + production.errors):
+                    continue
+                grammar.try_add(Production(
+                    sym_top, total + production.errors, production.rhs
                 ).set_prefix(
-                    current_prod.prefix + production.prefix
+                    chain_prefix + production.prefix
                 ).set_suffix(
-                    production.suffix + current_prod.suffix
+                    production.suffix + chain_suffix
                 ).set_replaced(
                     production.replaced
                 ).set_inserted(
                     production.inserted
                 ))
-    if current_prod.rhs in nt_units:
-        for rhs, production in nt_units[current_prod.rhs].items():
-            if not production.exclude_units:
-                production.exclude_units = True
-                new_prod = Production(
-                    '{0} ->{1} {2}'.format(
-                        current_prod.rhs,
-                        current_prod.errors + production.errors,
-                        rhs)
-                    ).set_prefix(
-                        current_prod.prefix + production.prefix
-                    ).set_suffix(
-                        production.suffix + current_prod.suffix
-                    )
-                convert_units(grammar, nt_units, sym_top, new_prod)
-                production.exclude_units = False
+            stack.append((total, chain_prefix, chain_suffix,
+                          iter(nt_units.get(rhs, {}).items())))
+            break
+        else:
+            stack.pop()
+
+
+def build_cover(grammar):
+    """Returns the covering grammar of grammar in Chomsky Normal Form, with
+    the error productions and without epsilon or unit productions."""
+    grammar_p = construct_covering(grammar)
+    eliminate_epsilon_productions(grammar_p)
+    eliminate_unit_productions(grammar_p)
+    return grammar_p
+
+
+def apply_diff(lines, diff_lines):
+    """Returns the lines of a grammar file changed by diff_lines. The hunks
+    of a unified diff are applied at their line numbers. Outside of hunks,
+    a line starting with '-' removes the production with the same sides and
+    one starting with '+' adds a production at the end."""
+    lines = list(lines)
+    patched, position, hunk = [], 0, False
+    removed, added = set(), []
+    for line in diff_lines:
+        if line.startswith(('---', '+++')):
+            continue
+        match = re.match(r'@@ -(\d+)(?:,(\d+))? ', line)
+        if match:
+            start = int(match.group(1))
+            if match.group(2) != '0':
+                start -= 1
+            patched.extend(lines[position:start])
+            position, hunk = start, True
+        elif hunk and line.startswith(' '):
+            patched.append(lines[position])
+            position += 1
+        elif hunk and line.startswith('-'):
+            position += 1
+        elif hunk and line.startswith('+'):
+            patched.append(line[1:])
+        elif line.startswith('-') and line[1:].strip():
+            removed.add(Production(line[1:]).to_tuple()[:2])
+        elif line.startswith('+') and line[1:].strip():
+            added.append(line[1:])
+    patched.extend(lines[position:])
+    patched = [line for line in patched if not line.strip() or
+               Production(line).to_tuple()[:2] not in removed]
+    if patched and added and not patched[-1].endswith('\n'):
+        patched[-1] += '\n'
+    return patched + added
+
+
+def cover_blocks(lines):
+    """Returns {lhs: lines} with the productions of every left hand side of
+    a covering grammar file, without their line ends."""
+    blocks = {}
+    for line in lines:
+        line = line.rstrip('\n')
+        if line:
+            blocks.setdefault(line.split(' ->', 1)[0], []).append(line)
+    return blocks
+
+
+def cover_production(line):
+    """Returns the Production of a line of a covering grammar, split at its
+    separators rather than matched like Production(line)."""
+    head, inserted, replaced, deleted, prefix, suffix = line.split(':')
+    lhs, rest = head.split(' ->', 1)
+    errors, rhs = rest.split(' ', 1)
+    return grammar_cache.make_production(
+        [lhs, errors, rhs, inserted, replaced, deleted, prefix, suffix])
+
+
+def unit_closure(nt_units, symbols, reverse=False):
+    """Returns the symbols that reach one of symbols through unit
+    productions, or with reverse those reached from them, and symbols."""
+    edges = nt_units
+    if reverse:
+        edges = {}
+        for lhs, units in nt_units.items():
+            for rhs in units:
+                edges.setdefault(rhs, []).append(lhs)
+    found = set(symbols)
+    stack = list(symbols)
+    while stack:
+        for symbol in edges.get(stack.pop(), ()):
+            if symbol not in found:
+                found.add(symbol)
+                stack.append(symbol)
+    return found
+
+
+def update_cover(grammar, cover_lines, new_grammar):
+    """Returns str(build_cover(new_grammar)) patched from cover_lines, the
+    lines of the covering grammar of grammar. The first two stages are cheap
+    and are run on both grammars; the productions they give each symbol are
+    compared, and the units of only the symbols that reach a changed one
+    through unit productions are converted again. Every other symbol keeps
+    its lines of the old cover, which are also read back for the converted
+    symbols that reach it."""
+    stages = []
+    for source in (grammar, new_grammar):
+        grammar_p = construct_covering(source)
+        eliminate_epsilon_productions(grammar_p)
+        stages.append(grammar_p)
+    old_p, grammar_p = stages
+    changed = set()
+    for lhs in set(old_p.productions) | set(grammar_p.productions):
+        old_block = old_p.productions.get(lhs, {}).values()
+        block = grammar_p.productions.get(lhs, {}).values()
+        if list(map(str, old_block)) != list(map(str, block)):
+            changed.add(lhs)
+    nt_units = {lhs: dict(units)
+                for lhs, units in grammar_p.nonterminal_units.items()}
+    # Units are converted in this order, and a symbol converted before
+    # another that reaches it is read after its own conversion.
+    order = [lhs for lhs, units in nt_units.items() if units]
+    position = {lhs: index for index, lhs in enumerate(order)}
+    old_order = [lhs for lhs, units in old_p.nonterminal_units.items()
+                 if units]
+    old_position = {lhs: index for index, lhs in enumerate(old_order)}
+    seeds = set(changed)
+    # Symbols kept by both orders are mostly in the same order, and then
+    # none of them is read before or after its conversion differently.
+    if ([lhs for lhs in order if lhs in old_position] !=
+            [lhs for lhs in old_order if lhs in position]):
+        for lhs in order:
+            if lhs not in old_position:
+                continue
+            for symbol in unit_closure(nt_units, [lhs]):
+                if (symbol in position and symbol in old_position and
+                        (position[symbol] < position[lhs]) !=
+                        (old_position[symbol] < old_position[lhs])):
+                    seeds.add(lhs)
+                    break
+    affected = unit_closure(nt_units, seeds, reverse=True)
+    needed = set()
+    for lhs in affected & set(order):
+        needed.update(symbol for symbol in unit_closure(nt_units, [lhs])
+                      if position.get(symbol, len(order)) < position[lhs])
+    blocks = cover_blocks(cover_lines)
+    for sym_top in order:
+        if sym_top in affected:
+            convert_units(grammar_p, nt_units, sym_top)
+        elif sym_top in needed:
+            productions = {}
+            for line in blocks.get(sym_top, ()):
+                production = cover_production(line)
+                productions[production.rhs] = production
+            productions.update(grammar_p.nonterminal_units[sym_top])
+            grammar_p.productions[sym_top] = productions
+    lines = []
+    for lhs, productions in grammar_p.productions.items():
+        if lhs in affected or lhs in changed:
+            units = grammar_p.nonterminal_units.get(lhs, {})
+            lines.extend(str(production) for rhs, production in
+                         productions.items() if rhs not in units)
+        else:
+            lines.extend(blocks.get(lhs, ()))
+    return "\n".join(lines)
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('grammar_file', type=argparse.FileType('r'),
                         help="grammar file of rule to use")
+    parser.add_argument('-o', '--output',
+                        help="write the covering grammar to this file, "
+                        "together with its binary cache, instead of stdout")
+    parser.add_argument('--diff', type=argparse.FileType('r'),
+                        help="productions to add ('+') to and remove ('-') "
+                        "from grammar_file before covering it, or a unified "
+                        "diff of it")
+    parser.add_argument('--update', metavar='COVER',
+                        type=argparse.FileType('r'),
+                        help="covering grammar of grammar_file to patch with "
+                        "the changes of --diff instead of building one")
     args = parser.parse_args()
+    if args.update and not args.diff:
+        parser.error("--update needs --diff")
 
+    lines = args.grammar_file.readlines()
     grammar = Grammar()
-    for line in args.grammar_file:
+    for line in lines:
         grammar.add_production(line)
-    grammar_p = construct_covering(grammar)
-    eliminate_epsilon_productions(grammar_p)
-    eliminate_unit_productions(grammar_p)
-    print(grammar_p)
+    if args.diff:
+        new_grammar = Grammar()
+        for line in apply_diff(lines, args.diff):
+            new_grammar.add_production(line)
+    if args.update:
+        text = update_cover(grammar, args.update, new_grammar)
+    else:
+        text = str(build_cover(new_grammar if args.diff else grammar))
+    if args.output:
+        text += "\n"
+        with open(args.output, 'w') as output:
+            output.write(text)
+        lines = text.splitlines(True)
+        grammar_cache.write_cache(grammar_cache.compile_lines(lines), text,
+                                  grammar_cache.cache_path(args.output))
+    else:
+        print(text)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,147 @@
+"""Binary cache of compiled covering grammars.
+
+The cache of 'grammar.txt' is stored next to it as 'grammar.txt.bin' and
+holds the flat rule arrays of its CompiledGrammar, the symbol names and the
+fields of every production. The file is memory mapped and the rule arrays
+are used in place. It is keyed by the SHA-256 of the grammar text, so it is
+rebuilt whenever the grammar file changes.
+"""
+import hashlib
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from classes import Production, Grammar, CompiledGrammar
+
+SUFFIX = '.bin'
+MAGIC = b'ECPG1' + (b'L' if sys.byteorder == 'little' else b'B')
+# magic, digest, symbols, rules, terminal entries, text size
+HEADER = struct.Struct('=6s32s4I')
+SEPARATOR = '\0'
+
+
+def cache_path(grammar_path):
+    return grammar_path + SUFFIX
+
+
+def digest(grammar_text):
+    return hashlib.sha256(grammar_text.encode('utf-8')).digest()
+
+
+def production_fields(production):
+    return [production.lhs, str(production.errors), production.rhs,
+            str(production.inserted), production.replaced,
+            production.deleted, production.prefix, production.suffix]
+
+
+def make_production(fields):
+    lhs, errors, rhs, inserted, replaced, deleted, prefix, suffix = fields
+    return Production(lhs, int(errors), rhs).set_inserted(
+        inserted == 'True').set_replaced(replaced).set_deleted(
+            deleted).set_prefix(prefix).set_suffix(suffix)
+
+
+def write_cache(grammar, grammar_text, path):
+    """Writes the CompiledGrammar of grammar_text to path."""
+    terminals = [(char, entry)
+                 for char, entries in grammar.terminal_table.items()
+                 for entry in entries]
+    terminal_ints = array('i')
+    strings = list(grammar.symbols)
+    strings.extend(char for char, _ in terminals)
+    for production in grammar.rule_production:
+        strings.extend(production_fields(production))
+    for _, (symbol, errors, production) in terminals:
+        terminal_ints.extend((symbol, errors))
+        strings.extend(production_fields(production))
+    text = SEPARATOR.join(strings).encode('utf-8')
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'wb') as cache_file:
+        cache_file.write(HEADER.pack(
+            MAGIC, digest(grammar_text), grammar.size,
+            len(grammar.rule_lhs), len(terminals), len(text)))
+        for values in (grammar.rule_lhs, grammar.rule_left,
+                       grammar.rule_right, grammar.rule_cost, terminal_ints):
+            cache_file.write(array('i', values).tobytes())
+        cache_file.write(text)
+    os.replace(tmp_path, path)
+
+
+def read_cache(path, grammar_text):
+    """Returns the CompiledGrammar stored at path, or None when the file is
+    missing, unreadable or was built from a different grammar text."""
+    try:
+        with open(path, 'rb') as cache_file:
+            buf = mmap.mmap(cache_file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    if len(buf) < HEADER.size:
+        return None
+    magic, key, symbols, rules, terminals, text_size = HEADER.unpack_from(buf)
+    item = array('i').itemsize
+    size = HEADER.size + (4 * rules + 2 * terminals) * item + text_size
+    if magic != MAGIC or key != digest(grammar_text) or len(buf) != size:
+        return None
+    view = memoryview(buf)
+    offset = HEADER.size
+
+    def ints(count):
+        nonlocal offset
+        values = view[offset:offset + count * item].cast('i')
+        offset += count * item
+        return values
+
+    grammar = CompiledGrammar()
+    grammar.cache_buffer = buf
+    grammar.rule_lhs = ints(rules)
+    grammar.rule_left = ints(rules)
+    grammar.rule_right = ints(rules)
+    grammar.rule_cost = ints(rules)
+    terminal_ints = ints(2 * terminals)
+    text = bytes(view[offset:]).decode('utf-8')
+    # An empty grammar has no strings, but ''.split() would give [''].
+    strings = text.split(SEPARATOR) if text else []
+    for symbol in strings[:symbols]:
+        grammar.intern(symbol)
+    chars = strings[symbols:symbols + terminals]
+    fields = strings[symbols + terminals:]
+    productions = [make_production(fields[index:index + 8])
+                   for index in range(0, len(fields), 8)]
+    grammar.rule_production = productions[:rules]
+    for index, char in enumerate(chars):
+        grammar.terminal_table.setdefault(char, []).append(
+            (terminal_ints[2 * index], terminal_ints[2 * index + 1],
+             productions[rules + index]))
+    grammar.index_rules()
+    return grammar
+
+
+def compile_lines(grammar_lines):
+    """Parses the lines of a covering grammar file into a CompiledGrammar."""
+    grammar = Grammar()
+    for line in grammar_lines:
+        grammar.add_production(line)
+    return CompiledGrammar(grammar)
+
+
+def load_compiled(grammar_lines, grammar_path=None):
+    """Returns the CompiledGrammar of the given grammar file lines. With a
+    grammar_path the binary cache next to it is used when it matches the
+    lines; otherwise the lines are compiled and the cache is written for the
+    next run. A cache that cannot be written is skipped.
+    """
+    grammar_text = "".join(grammar_lines)
+    path = cache_path(grammar_path) if grammar_path else None
+    if path:
+        grammar = read_cache(path, grammar_text)
+        if grammar is not None:
+            return grammar
+    grammar = compile_lines(grammar_lines)
+    if path:
+        try:
+            write_cache(grammar, grammar_text, path)
+        except OSError:
+            pass
+    return grammar
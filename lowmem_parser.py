@@ -0,0 +1,142 @@
+from array import array
+
+from classes import cost_tree, not_found
+
+# Bytes that a cell of a Matrix keeps beside its width of entries: the
+# array object of its symbol list and the room it grows into.
+MATRIX_CELL_BYTES = 200
+# Bytes of every entry of a Matrix: the errors, production and split of each
+# symbol and its place in the symbol list.
+MATRIX_ENTRY_BYTES = 12
+
+
+class CompactTable(object):
+    """Costs of a CYK fill without backpointers. Row i holds the errors of
+    the cells (i, j) one after the other as runs of width entries, one byte
+    each when every cost that is kept fits, and the symbols of its cells as
+    one array with the end of each cell in ends, since the cells of a row
+    are filled in order of their length."""
+    def __init__(self, size, width, max_errors=None):
+        small = max_errors is not None and max_errors < 0xFF
+        self.unreachable = 0xFF if small else 0xFFFF
+        self.width = width
+        code = 'B' if small else 'H'
+        self.costs = [array(code, [self.unreachable]) * ((size - i) * width)
+                      for i in range(0, size)]
+        code = 'B' if width <= 0x100 else 'H'
+        self.symbols = [array(code) for _ in range(size)]
+        self.ends = [array('I') for _ in range(size)]
+
+    def cell_symbols(self, i, j):
+        ends = self.ends[i-1]
+        if j - i > len(ends):
+            return ()
+        start = ends[j-i-2] if j - i > 1 else 0
+        return self.symbols[i-1][start:ends[j-i-1]]
+
+    def close_cell(self, i, symbols):
+        """Adds the symbols of the next cell of row i."""
+        row = self.symbols[i-1]
+        row.extend(symbols)
+        self.ends[i-1].append(len(row))
+
+    def cost(self, symbol, i, j):
+        return self.costs[i-1][(j-i-1) * self.width + symbol]
+
+    @staticmethod
+    def estimate(size, width, max_errors=None):
+        """Returns about how many bytes the table of an input of size
+        characters takes at most."""
+        cells = size * (size + 1) // 2
+        cost = 1 if max_errors is not None and max_errors < 0xFF else 2
+        symbol = 1 if width <= 0x100 else 2
+        # The symbol arrays grow by an eighth at a time, and every row has
+        # three array objects.
+        return cells * (width * (cost + symbol) + 4) * 5 // 4 + size * 200
+
+
+def matrix_estimate(size, width):
+    """Returns about how many bytes the Matrix of error_correcting_parser
+    takes at most for an input of size characters."""
+    cells = size * (size + 1) // 2
+    return cells * (width * MATRIX_ENTRY_BYTES + MATRIX_CELL_BYTES)
+
+
+def lowmem_parser(grammar, input_string, max_errors=None):
+    """Takes a CompiledGrammar and an input string and returns the same
+    (errors, tree) tuple as error_correcting_parser, keeping only the costs
+    of the fill in a CompactTable. The split and rule of each node of the
+    tree are found again from the costs of its two halves, trying splits
+    and then rules in order, which makes the same choices as the cyk
+    engine. The table takes about a fifth of the memory of a Matrix, or
+    less with max_errors below 255, at the price of a slower traceback.
+    """
+    limits = grammar.error_limits(max_errors)
+    input_size = len(input_string)
+    table = CompactTable(input_size, grammar.size, max_errors)
+    last_filled = 0
+    for i in range(1, input_size + 1):
+        row, symbols = table.costs[i-1], []
+        for A, errors, _ in grammar.terminal_table.get(input_string[i-1], ()):
+            if errors <= limits[A] and errors < row[A]:
+                if row[A] == table.unreachable:
+                    symbols.append(A)
+                row[A] = errors
+        if symbols:
+            last_filled = 1
+        table.close_cell(i, symbols)
+    rules_by_pair = grammar.pair_rules(limits)
+    for depth in range(2, input_size + 1):
+        if depth > 2 * last_filled:
+            break
+        for i in range(1, input_size - depth + 2):
+            if fill_costs(table, rules_by_pair, i, i + depth):
+                last_filled = depth
+    least_err = table.cost(grammar.top, 1, input_size + 1)
+    if least_err == table.unreachable:
+        raise not_found(max_errors)
+    return least_err, compact_tree(table, grammar, input_string, least_err)
+
+
+def fill_costs(table, rules_by_pair, i, j):
+    """Fills the costs of cell (i, j) of a CompactTable like fill_cell does
+    for a Matrix, keeping only the fewest errors of each symbol, and returns
+    whether any entry was stored."""
+    costs, width, unreachable = table.costs, table.width, table.unreachable
+    best, cell = costs[i-1], (j-i-1) * width
+    symbols = []
+    for k in range(i + 1, j):
+        right_symbols = table.cell_symbols(k, j)
+        if not right_symbols:
+            continue
+        left_base = (k-i-1) * width
+        right, right_base = costs[k-1], (j-k-1) * width
+        for B in table.cell_symbols(i, k):
+            pairs = rules_by_pair.get(B)
+            if pairs is None:
+                continue
+            l_1 = best[left_base + B]
+            if len(pairs) <= len(right_symbols):
+                pairs = pairs.items()
+            else:
+                pairs = [(C, pairs[C]) for C in right_symbols if C in pairs]
+            for C, rules in pairs:
+                l_2 = right[right_base + C]
+                if l_2 == unreachable:
+                    continue
+                for lhs, l_3, _, limit in rules:
+                    l_total = l_1 + l_2 + l_3
+                    index = cell + lhs
+                    if l_total > limit or l_total >= best[index]:
+                        continue
+                    if best[index] == unreachable:
+                        symbols.append(lhs)
+                    best[index] = l_total
+    table.close_cell(i, symbols)
+    return bool(symbols)
+
+
+def compact_tree(table, grammar, input_string, errors):
+    """Builds the same parse tree as parse_tree from the costs of a
+    CompactTable."""
+    return cost_tree(grammar, input_string, errors, table.cost)
@@ -0,0 +1,99 @@
+"""Client of parse_server.py.
+
+    $ python3 parse_client.py -u /tmp/parser.sock -s <input_string>
+    $ python3 parse_client.py -u /tmp/parser.sock -i <input_file> -k 3
+"""
+import argparse
+import json
+import socket
+import threading
+
+
+class ParseClient(object):
+    """Blocking connection to a parse server on a Unix socket path or a
+    localhost TCP port."""
+    def __init__(self, path=None, port=None):
+        if path is not None:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(path)
+        else:
+            self.sock = socket.create_connection(('127.0.0.1', port))
+        self.reader = self.sock.makefile('rb')
+        self.next_id = 0
+
+    def parse_many(self, input_strings, max_errors=None, engine=None):
+        """Sends a request for every input string at once and returns their
+        responses in the same order. The requests are sent from a thread
+        while the responses are read, so that neither side blocks on a full
+        socket buffer."""
+        ids = []
+        lines = []
+        for input_string in input_strings:
+            request = {'id': self.next_id, 'input': input_string}
+            if max_errors is not None:
+                request['max_errors'] = max_errors
+            if engine is not None:
+                request['engine'] = engine
+            ids.append(self.next_id)
+            lines.append(json.dumps(request).encode('utf-8') + b'\n')
+            self.next_id += 1
+        sender = threading.Thread(target=self.sock.sendall,
+                                  args=(b''.join(lines),))
+        sender.daemon = True
+        sender.start()
+        responses = {}
+        while len(responses) < len(ids):
+            line = self.reader.readline()
+            if not line:
+                raise ConnectionError("server closed the connection")
+            response = json.loads(line)
+            responses[response.get('id')] = response
+        sender.join()
+        return [responses[request_id] for request_id in ids]
+
+    def parse(self, input_string, max_errors=None, engine=None):
+        return self.parse_many([input_string], max_errors, engine)[0]
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+
+def format_response(response, max_errors=None):
+    """Returns a response in the format of error_parser.format_result."""
+    if 'error' in response:
+        return "I : %s\nerror: %s" % (response.get('input'), response['error'])
+    if response['errors'] is None:
+        return "I : %s\nI': over threshold\nE : >%d" % (response['input'],
+                                                        max_errors)
+    return "I : %s\nI': %s\nE : %d" % (response['input'],
+                                       response['corrected'],
+                                       response['errors'])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    server = parser.add_mutually_exclusive_group(required=True)
+    server.add_argument('-u', '--socket', help="Unix socket of the server")
+    server.add_argument('-p', '--port', type=int,
+                        help="localhost TCP port of the server")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('-s', '--string', help="string to test")
+    group.add_argument('-i', '--infile', type=argparse.FileType('r'),
+                       help="file of strings to be tested")
+    parser.add_argument('-e', '--engine', help="parsing engine to use")
+    parser.add_argument('-k', '--max-errors', type=int,
+                        help="only look for corrections with at most this "
+                        "many errors")
+    args = parser.parse_args()
+
+    client = ParseClient(args.socket, args.port)
+    input_strings = ([args.string] if args.string
+                     else [line.strip() for line in args.infile])
+    for response in client.parse_many(input_strings, args.max_errors,
+                                      args.engine):
+        print(format_response(response, args.max_errors))
+    client.close()
+
+if __name__ == '__main__':
+    main()
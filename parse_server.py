@@ -0,0 +1,244 @@
+"""Parse server with a preloaded covering grammar.
+
+The server listens on a Unix socket or a localhost TCP port and reads one
+JSON request per line:
+
+    {"id": 1, "input": "tactagcaat...", "max_errors": 3, "engine": "cyk"}
+
+Only "input" is required. Every request gets one JSON line back with the
+same id, the input, its errors and its correction, both null when it has
+more than max_errors errors, or an "error" message:
+
+    {"id": 1, "input": "tactagcaat...", "errors": 2, "corrected": "tac..."}
+
+Responses on a connection come back in the order they are done, so a client
+that sends several requests at once matches them by id. Requests from all
+connections are gathered into batches for a pool of worker processes, each
+of which loads the grammar once. The queue of waiting requests is bounded:
+once it is full the server stops reading from the connections until the
+workers catch up.
+
+    $ python3 parse_server.py -g covering_grammar.txt -u /tmp/parser.sock -j 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+from concurrent.futures import ProcessPoolExecutor
+
+import error_parser
+from error_parser import ENGINES, find_correction, init_worker, load_grammar
+from result_cache import CACHE_SIZE, ResultCache
+
+# Requests waiting for a worker. Reading from clients stops while it is full.
+QUEUE_SIZE = 1024
+# Largest number of requests handed to a worker at once, and the longest a
+# request waits for others to join its batch, in seconds.
+BATCH_SIZE = 16
+BATCH_DELAY = 0.002
+
+
+def serve_chunk(requests):
+    """Answers a batch of requests in a worker process."""
+    grammar = error_parser.worker_state['grammar']
+    return [serve_request(grammar, request) for request in requests]
+
+
+def serve_request(grammar, request):
+    try:
+        result = find_correction(grammar, request['input'],
+                                 request.get('engine', 'cyk'),
+                                 request.get('max_errors'))
+    except LookupError as error:
+        return {'error': str(error)}
+    if result is None:
+        return {'errors': None, 'corrected': None}
+    return {'errors': result[0], 'corrected': result[1]}
+
+
+def check_request(request):
+    """Returns why a decoded request cannot be parsed, or None."""
+    if not isinstance(request, dict):
+        return "request must be a JSON object"
+    if not isinstance(request.get('input'), str):
+        return "request needs an 'input' string"
+    max_errors = request.get('max_errors')
+    if max_errors is not None and (not isinstance(max_errors, int) or
+                                   max_errors < 0):
+        return "'max_errors' must be a non negative integer"
+    if request.get('engine', 'cyk') not in ['cyk'] + sorted(ENGINES):
+        return "unknown engine {!r}".format(request.get('engine'))
+    return None
+
+
+class ParseServer(object):
+    """Asyncio front end over a process pool of jobs workers. Results are
+    kept in a ResultCache in the server, so repeated inputs are answered
+    without reaching a worker."""
+    def __init__(self, grammar_lines, grammar_path=None, jobs=1, cache=None):
+        self.grammar = load_grammar(grammar_lines, grammar_path)
+        self.cache = cache if cache is not None else ResultCache()
+        self.jobs = jobs
+        self.executor = ProcessPoolExecutor(
+            jobs, initializer=init_worker,
+            initargs=(grammar_lines, grammar_path, {}, None))
+        self.queue = None
+        self.slots = None
+
+    async def serve(self, path=None, port=None):
+        """Serves on the Unix socket path, or else on localhost port, until
+        cancelled, which SIGTERM does too."""
+        try:
+            asyncio.get_running_loop().add_signal_handler(
+                signal.SIGTERM, asyncio.current_task().cancel)
+        except NotImplementedError:
+            pass
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+        self.slots = asyncio.Semaphore(2 * self.jobs)
+        if path is not None:
+            server = await asyncio.start_unix_server(self.handle, path)
+        else:
+            server = await asyncio.start_server(self.handle, '127.0.0.1',
+                                                port)
+        batcher = asyncio.ensure_future(self.batch_requests())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+            self.executor.shutdown()
+
+    async def handle(self, reader, writer):
+        """Reads the requests of one connection and writes their responses
+        as they are done."""
+        loop = asyncio.get_running_loop()
+        pending = set()
+
+        def respond(request, response):
+            response = dict(response, id=request.get('id'),
+                            input=request.get('input'))
+            writer.write(json.dumps(response).encode('utf-8') + b'\n')
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    respond({}, {'error': "request is not valid JSON"})
+                    continue
+                problem = check_request(request)
+                if problem is not None:
+                    respond(request if isinstance(request, dict) else {},
+                            {'error': problem})
+                    continue
+                cached = self.cached(request)
+                if cached is not None:
+                    respond(request, cached)
+                    continue
+                future = loop.create_future()
+                future.add_done_callback(
+                    lambda done, request=request: respond(request,
+                                                          done.result()))
+                pending.add(future)
+                future.add_done_callback(pending.discard)
+                await self.queue.put((request, future))
+                await writer.drain()
+            if pending:
+                await asyncio.wait(pending)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def cached(self, request):
+        """Returns the response to a request from the ResultCache, or None."""
+        result = self.cache.get(self.grammar, request['input'])
+        if result is None:
+            return None
+        max_errors = request.get('max_errors')
+        if max_errors is not None and result[0] > max_errors:
+            return {'errors': None, 'corrected': None}
+        return {'errors': result[0], 'corrected': result[1]}
+
+    async def batch_requests(self):
+        """Takes requests from the queue in batches of up to BATCH_SIZE,
+        waiting at most BATCH_DELAY for a batch to fill, and hands them to
+        the workers with at most two batches per worker in flight."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + BATCH_DELAY
+            while len(batch) < BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(),
+                                                        timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self.slots.acquire()
+            work = loop.run_in_executor(self.executor, serve_chunk,
+                                        [request for request, _ in batch])
+            work.add_done_callback(
+                lambda done, batch=batch: self.finish(batch, done))
+
+    def finish(self, batch, work):
+        self.slots.release()
+        try:
+            responses = work.result()
+        except Exception as error:  # pylint: disable=W0703
+            responses = [{'error': str(error)}] * len(batch)
+        for (request, future), response in zip(batch, responses):
+            if response.get('corrected') is not None:
+                self.cache.put(self.grammar, request['input'],
+                               (response['errors'], response['corrected']))
+            if not future.done():
+                future.set_result(response)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-g', '--grammar_file', default='grammar.txt',
+                        type=argparse.FileType('r'),
+                        help="grammar file of rule to use")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('-u', '--socket', help="Unix socket to listen on")
+    group.add_argument('-p', '--port', type=int,
+                       help="localhost TCP port to listen on")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="number of worker processes")
+    parser.add_argument('--results', metavar='PATH',
+                        help="SQLite file to keep results in across runs")
+    parser.add_argument('--results-size', type=int, default=CACHE_SIZE,
+                        metavar='N', help="number of results kept in memory")
+    parser.add_argument('--no_cache', action='store_true',
+                        help="do not read or write the binary grammar cache")
+    args = parser.parse_args()
+
+    grammar_lines = args.grammar_file.readlines()
+    grammar_path = None
+    if not args.no_cache and os.path.isfile(args.grammar_file.name):
+        grammar_path = args.grammar_file.name
+    cache = ResultCache(args.results_size, args.results)
+    server = ParseServer(grammar_lines, grammar_path, args.jobs, cache)
+    if args.socket and os.path.exists(args.socket):
+        os.unlink(args.socket)
+    try:
+        asyncio.run(server.serve(args.socket, args.port))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    finally:
+        cache.close()
+        if args.socket and os.path.exists(args.socket):
+            os.unlink(args.socket)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Phase timings and work counters of single parses.
+
+A ParseStats handed to find_correction or error_correcting_parser records
+the wall time of every phase of the parse, marked one after the other, and
+the work of the cyk fill. record() returns them as a dict that is written
+as one JSON line per input by the --stats option of error_parser.py:
+
+    {"event": "parse", "n": 120, "errors": 3, "found_by": "parser",
+     "phases": {"recognize": 0.0004, "init": 0.0011, "rules": 0.0002,
+                "fill": 0.8, "tree": 0.0003, "correct": 0.0001},
+     "seconds": 0.81, "tried": 51234, "improved": 20431, "rejected": 30803,
+     "combined": 9034, "visited": [412, 388, ...], "table_cells": 7260,
+     "table_bytes": 2962080, "peak_rss_kb": 61234}
+
+tried counts the entries offered to the table, improved those that were
+stored because they were cheaper, or as cheap with an earlier split and
+rule, than the entry already there, and rejected the others. visited lists
+the cell entries read by the fill of each span length from 2 on and
+combined counts the pairs of them that some rule joined. peak_rss_kb is the
+peak resident memory of the process so far. A first line with "event":
+"load" gives the time taken to load the grammar and its size.
+"""
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+# Counters of the cyk Matrix copied into a record.
+MATRIX_COUNTERS = ('tried', 'improved', 'combined')
+
+
+def peak_rss_kb():
+    """Returns the peak resident memory of the process in KiB, or None
+    where the resource module is missing."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def load_record(grammar, seconds):
+    """Returns the record of loading the CompiledGrammar grammar in seconds,
+    the first JSON line of --stats."""
+    return {'event': 'load', 'seconds': seconds, 'symbols': grammar.size,
+            'rules': len(grammar.rule_lhs), 'peak_rss_kb': peak_rss_kb()}
+
+
+class ParseStats(object):
+    """Phases and counters of one parse. mark(name) ends the phase name,
+    which started at the previous mark or at creation. fields are copied
+    into the record as they are."""
+    def __init__(self):
+        self.start = self.last = time.perf_counter()
+        self.fields = {}
+        self.phases = {}
+        self.counters = {}
+        self.visited = []
+        self.seen = 0
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.phases[name] = self.phases.get(name, 0.0) + now - self.last
+        self.last = now
+
+    def end_depth(self, cyk_matrix):
+        """Records the entries the fill of one span length visited."""
+        self.visited.append(cyk_matrix.visited - self.seen)
+        self.seen = cyk_matrix.visited
+
+    def add_matrix(self, cyk_matrix):
+        for name in MATRIX_COUNTERS:
+            self.counters[name] = getattr(cyk_matrix, name)
+        self.counters['rejected'] = cyk_matrix.tried - cyk_matrix.improved
+        self.counters['table_cells'] = cyk_matrix.cells()
+        self.counters['table_bytes'] = cyk_matrix.nbytes()
+
+    def record(self):
+        """Returns the stats as a dict for a JSON line."""
+        record = {'event': 'parse'}
+        record.update(self.fields)
+        record['phases'] = self.phases
+        record['seconds'] = self.last - self.start
+        record.update(self.counters)
+        if self.visited:
+            record['visited'] = self.visited
+        record['peak_rss_kb'] = peak_rss_kb()
+        return record
@@ -0,0 +1,86 @@
+class Recognizer(object):
+    """Exact CYK recognizer over the productions of a CompiledGrammar that
+    cost no errors, which accepts exactly the strings of the original
+    grammar. Each cell is a Python int used as a bitset of symbols. The
+    rules are indexed by their left symbol B as the bitset of the symbols C
+    that follow it and the bitset of left hand sides of each pair (B, C),
+    and the left hand sides of two whole cells are kept in a table as they
+    are found, since the same pairs of cells come up over and over."""
+    def __init__(self, grammar):
+        self.top = grammar.top
+        self.chars = {}
+        for char, entries in grammar.terminal_table.items():
+            bits = 0
+            for A, errors, _ in entries:
+                if errors == 0:
+                    bits |= 1 << A
+            if bits:
+                self.chars[char] = bits
+        self.lefts = 0
+        self.all_rights = 0
+        self.rights = {}
+        self.products = {}
+        for lhs, B, C, cost, _ in grammar.rules():
+            if cost:
+                continue
+            self.lefts |= 1 << B
+            self.all_rights |= 1 << C
+            self.rights[B] = self.rights.get(B, 0) | 1 << C
+            products = self.products.setdefault(B, {})
+            products[C] = products.get(C, 0) | 1 << lhs
+        self.table = {}
+
+    def combine(self, left, right):
+        """Returns the bitset of left hand sides of the rules B C with B in
+        left and C in right."""
+        key = (left, right)
+        if key in self.table:
+            return self.table[key]
+        bits = 0
+        rest = left
+        while rest:
+            low = rest & -rest
+            rest ^= low
+            B = low.bit_length() - 1
+            both = right & self.rights[B]
+            products = self.products[B]
+            while both:
+                low = both & -both
+                both ^= low
+                bits |= products[low.bit_length() - 1]
+        self.table[key] = bits
+        return bits
+
+    def accepts(self, input_string):
+        """Returns whether the top symbol derives input_string with no
+        errors."""
+        input_size = len(input_string)
+        if not input_size or self.top is None:
+            return False
+        cells = [[0] * (input_size + 1) for _ in range(input_size)]
+        for i, input_char in enumerate(input_string):
+            bits = self.chars.get(input_char)
+            if bits is None:
+                return False
+            cells[i][i+1] = bits
+        lefts, rights = self.lefts, self.all_rights
+        for depth in range(2, input_size + 1):
+            for i in range(input_size - depth + 1):
+                j = i + depth
+                row = cells[i]
+                bits = 0
+                for k in range(i + 1, j):
+                    left = row[k] & lefts
+                    right = cells[k][j] & rights
+                    if left and right:
+                        bits |= self.combine(left, right)
+                row[j] = bits
+        return bool(cells[0][input_size] >> self.top & 1)
+
+
+def recognizer(grammar):
+    """Returns the Recognizer of a CompiledGrammar, built on first use and
+    kept with the grammar."""
+    if getattr(grammar, 'exact', None) is None:
+        grammar.exact = Recognizer(grammar)
+    return grammar.exact
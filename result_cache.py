@@ -0,0 +1,101 @@
+"""Cache of parse results.
+
+Results are (errors, corrected string) pairs keyed by the content hash of
+the CompiledGrammar and the input string. The most recently used ones are
+kept in memory, up to a fixed number, and with a path every result is also
+stored in an SQLite database there so that later runs find it too.
+"""
+import collections
+import sqlite3
+
+# Results kept in memory by default.
+CACHE_SIZE = 1 << 16
+
+SCHEMA = """CREATE TABLE IF NOT EXISTS results (
+    grammar TEXT NOT NULL,
+    input TEXT NOT NULL,
+    errors INTEGER NOT NULL,
+    corrected TEXT NOT NULL,
+    PRIMARY KEY (grammar, input))"""
+
+
+class ResultCache(object):
+    """LRU of parse results in front of an optional SQLite store. hits
+    counts the results found in memory, disk_hits those found in the store
+    and misses those that had to be parsed."""
+    def __init__(self, size=CACHE_SIZE, path=None):
+        self.size = size
+        self.path = path
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.db = None
+        if path is not None:
+            self.db = sqlite3.connect(path, timeout=60)
+            self.db.execute(SCHEMA)
+            self.db.commit()
+
+    def get(self, grammar, input_string):
+        """Returns the cached (errors, corrected string) of input_string
+        under the CompiledGrammar grammar, or None."""
+        key = (grammar.content_hash(), input_string)
+        result = self.entries.get(key)
+        if result is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return result
+        if self.db is not None:
+            row = self.db.execute(
+                "SELECT errors, corrected FROM results "
+                "WHERE grammar = ? AND input = ?", key).fetchone()
+            if row is not None:
+                self.disk_hits += 1
+                self.remember(key, tuple(row))
+                return tuple(row)
+        self.misses += 1
+        return None
+
+    def put(self, grammar, input_string, result):
+        key = (grammar.content_hash(), input_string)
+        self.remember(key, result)
+        if self.db is not None:
+            self.db.execute("INSERT OR REPLACE INTO results "
+                            "VALUES (?, ?, ?, ?)", key + tuple(result))
+            self.db.commit()
+
+    def remember(self, key, result):
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        """Returns the counters as a dict, with the share of lookups that
+        were answered from memory or the store as hit_rate."""
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': ((self.hits + self.disk_hits) / lookups
+                         if lookups else 0.0),
+        }
+
+    def take_stats(self):
+        """Returns the stats and sets the counters back to zero."""
+        stats = self.stats()
+        self.hits = self.disk_hits = self.misses = 0
+        return stats
+
+    def add_stats(self, stats):
+        """Adds the counters of the stats of another cache, such as that of
+        a worker process."""
+        self.hits += stats['hits']
+        self.disk_hits += stats['disk_hits']
+        self.misses += stats['misses']
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
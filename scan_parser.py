@@ -0,0 +1,143 @@
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+from dense_parser import BLOCK_SIZE, DenseGrammar
+
+
+class BandedTable(object):
+    """CYK cells of a long sequence restricted to spans of at most width
+    symbols, stored as a float32 array indexed [symbol, end, length] so that
+    each cell is computed once and shared by every window that contains it.
+    Rows are kept for the ends of the current block and the width ends before
+    it, which is all that the cells of the block can refer to."""
+    def __init__(self, grammar, width, block):
+        self.width = width
+        self.data = np.full((grammar.size, width + block, width + 1), np.inf,
+                            dtype=np.float32)
+
+    def shift(self, count):
+        """Moves the last width rows to the front to make room for the next
+        count ends."""
+        data = self.data
+        data[:, :self.width] = data[:, count:count + self.width]
+        data[:, self.width:] = np.inf
+
+
+def terminal_costs(grammar, codes, limits):
+    """Returns a [symbol, code] array with the cost of deriving each of the
+    characters codes from each symbol in one step."""
+    costs = np.full((grammar.size, len(codes)), np.inf, dtype=np.float32)
+    for column, code in enumerate(codes):
+        for A, errors, _ in grammar.terminal_table.get(chr(code), ()):
+            if errors <= limits[A]:
+                costs[A, column] = min(costs[A, column], errors)
+    return costs
+
+
+def fill_block(table, dense, limits, count):
+    """Computes the cells of every span of length 2 to width that ends at one
+    of the count block rows, in order of length. The split of [i, j) into
+    [i, i+t) and [i+t, j) reads the left part from row j-length+t and the
+    right part from row j. With a bound most symbols have no entry of a
+    given length anywhere in the table, and the pairs and rules that need
+    one are left out of the reductions."""
+    data = table.data
+    strides = data.strides
+    width = table.width
+    rows = slice(width, width + count)
+    alive = np.isfinite(data).any(axis=1)
+    for depth in range(2, width + 1):
+        active = np.flatnonzero((alive[dense.pair_left, 1:depth] &
+                                 alive[dense.pair_right, depth-1:0:-1]).any(
+                                     axis=1))
+        if not len(active):
+            continue
+        left = as_strided(data[:, width - depth + 1:, 1:],
+                          shape=(data.shape[0], count, depth - 1),
+                          strides=(strides[0], strides[1],
+                                   strides[1] + strides[2]))
+        right = as_strided(data[:, width:, depth - 1:],
+                           shape=(data.shape[0], count, depth - 1),
+                           strides=(strides[0], strides[1], -strides[2]))
+        pairs = np.full((len(dense.pair_left), count), np.inf,
+                        dtype=np.float32)
+        pairs[active] = np.add(left[dense.pair_left[active]],
+                               right[dense.pair_right[active]]).min(axis=2)
+        rules = np.flatnonzero(np.isin(dense.rule_pair, active))
+        lhs = dense.rule_lhs[rules]
+        group_start = np.flatnonzero(np.r_[True, lhs[1:] != lhs[:-1]])
+        group_lhs = lhs[group_start]
+        costs = pairs[dense.rule_pair[rules]] + dense.rule_cost[rules, None]
+        best = np.minimum.reduceat(costs, group_start, axis=0)
+        best[best > limits[group_lhs, None]] = np.inf
+        data[group_lhs, rows, depth] = np.minimum(
+            data[group_lhs, rows, depth], best)
+        alive[group_lhs, depth] |= np.isfinite(best).any(axis=1)
+
+
+def span_costs(grammar, sequence, width, max_errors=None):
+    """Yields (start, costs) blocks where costs is a [end, length] array with
+    the distance to the grammar of every substring sequence[end-length:end]
+    of at most width symbols, and row r holds the substrings ending at
+    start+r+1. Substrings that would start before the sequence, and those
+    further away than max_errors, are infinity. The sequence is filled in
+    blocks of ends so that memory stays bounded however long it is."""
+    dense = DenseGrammar(grammar)
+    limits = np.array(grammar.error_limits(max_errors), dtype=np.float32)
+    chars = np.frombuffer(sequence.encode('utf-32-le'), dtype=np.uint32)
+    codes, columns = np.unique(chars, return_inverse=True)
+    terminals = terminal_costs(grammar, codes, limits)
+    block = max(1, BLOCK_SIZE // (max(len(dense.pair_left), 1) * width))
+    table = BandedTable(grammar, width, block)
+    for start in range(0, len(sequence), block):
+        count = min(block, len(sequence) - start)
+        if start:
+            table.shift(block)
+        table.data[:, width:width + count, 1] = \
+            terminals[:, columns[start:start + count]]
+        if len(dense.rule_pair):
+            fill_block(table, dense, limits, count)
+        yield start, table.data[grammar.top, width:width + count]
+
+
+def scan_windows(grammar, sequence, width, max_errors):
+    """Yields (start, end, errors) for every window sequence[start:end] of
+    width symbols whose distance to the grammar is at most max_errors."""
+    for start, costs in span_costs(grammar, sequence, width, max_errors):
+        costs = costs[:, width]
+        for row in np.flatnonzero(costs <= max_errors):
+            end = start + row + 1
+            yield int(end - width), int(end), int(costs[row])
+
+
+def scan_maximal(grammar, sequence, width, max_errors):
+    """Yields (start, end, errors) for every substring sequence[start:end] of
+    at most width symbols whose distance to the grammar is at most
+    max_errors and that is not contained in a longer such substring. The
+    longest match ending at each position is contained in another match
+    exactly when one of the next width ends reaches back at least as far, so
+    positions are held back until the width ends after them are known."""
+    size = len(sequence)
+    ends = np.zeros(0, dtype=np.intp)
+    starts = np.zeros(0, dtype=np.intp)
+    errors = np.zeros(0, dtype=np.float32)
+    for start, costs in span_costs(grammar, sequence, width, max_errors):
+        hits = costs[:, 1:] <= max_errors
+        found = hits.any(axis=1)
+        longest = width - np.argmax(hits[:, ::-1], axis=1)
+        block_ends = np.arange(start + 1, start + len(costs) + 1)
+        ends = np.r_[ends, block_ends[found]]
+        starts = np.r_[starts, (block_ends - longest)[found]]
+        errors = np.r_[errors, costs[np.flatnonzero(found), longest[found]]]
+        known = start + len(costs) if start + len(costs) < size else None
+        done = len(ends) if known is None else np.searchsorted(
+            ends, known - width, side='right')
+        # The matches ending after ends[index] that can contain it.
+        later = np.full(done, size + 1)
+        for index in range(done):
+            stop = np.searchsorted(ends, ends[index] + width, side='right')
+            if stop > index + 1:
+                later[index] = starts[index + 1:stop].min()
+        for index in np.flatnonzero(starts[:done] < later):
+            yield int(starts[index]), int(ends[index]), int(errors[index])
+        ends, starts, errors = ends[done:], starts[done:], errors[done:]
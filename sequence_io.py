@@ -0,0 +1,243 @@
+"""Reading of input sequences and writing of parse results.
+
+read_records yields the (name, sequence) records of a plain file of one
+string per line, named by line number, or of a FASTA or FASTQ file, told
+apart by their first character. Gzipped files, pipes and other files that
+are not regular are streamed; regular files are memory mapped, and the
+sequences of FASTA records are sliced out of the map between headers in one
+piece. Records are read lazily, so files larger than memory can be parsed.
+
+ResultWriter writes the results as the text of error_parser.py, as JSON
+lines or as tab separated values, through a large buffer that is also
+written out before the caller waits for the next result.
+"""
+import gzip
+import io
+import json
+import mmap
+import os
+import stat
+import sys
+import time
+
+GZIP_MAGIC = b'\x1f\x8b'
+WHITESPACE = b' \t\n\r\x0b\x0c'
+# Characters a ResultWriter gathers before writing them out.
+WRITE_BUFFER = 1 << 20
+# Seconds a ResultWriter holds results before writing them out.
+FLUSH_INTERVAL = 1.0
+FORMATS = ('text', 'jsonl', 'tsv')
+
+
+def read_records(path):
+    """Yields the (name, sequence) records of the file at path, or of stdin
+    for '-'. Blank lines are skipped."""
+    if path == '-':
+        for record in stream_records(open_stream(sys.stdin.buffer)):
+            yield record
+        return
+    with open(path, 'rb') as infile:
+        stream = open_stream(infile)
+        info = os.fstat(infile.fileno())
+        if stream is not infile or not stat.S_ISREG(info.st_mode) or \
+                info.st_size == 0:
+            for record in stream_records(stream):
+                yield record
+            return
+        with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for record in mapped_records(data):
+                yield record
+
+
+def open_stream(stream):
+    """Returns a buffered binary stream, read through gzip when it starts
+    with GZIP_MAGIC. The magic is peeked at rather than read, so that pipes,
+    which cannot seek, are read in full."""
+    if stream.peek(len(GZIP_MAGIC))[:len(GZIP_MAGIC)] == GZIP_MAGIC:
+        return io.BufferedReader(gzip.GzipFile(fileobj=stream))
+    return stream
+
+
+def first_char(data):
+    """Returns the first character of the first non blank line of a memory
+    map, as bytes."""
+    for index in range(len(data)):
+        char = data[index:index + 1]
+        if not char.isspace():
+            return char
+    return b''
+
+
+def mapped_records(data):
+    """Yields the records of a memory mapped file."""
+    if first_char(data) != b'>':
+        for record in stream_records(data):
+            yield record
+        return
+    start = data.find(b'>')
+    size = len(data)
+    number = data[:start].count(b'\n') + 1
+    while start != -1:
+        end = data.find(b'\n>', start)
+        end = size if end == -1 else end + 1
+        line_end = data.find(b'\n', start, end)
+        if line_end == -1:
+            line_end = end
+        name = fasta_name(data[start:line_end], number)
+        sequence = data[line_end:end]
+        yield name, sequence.translate(None, WHITESPACE).decode('latin-1')
+        number += sequence.count(b'\n')
+        start = end if end < size else -1
+
+
+def fasta_name(header, number):
+    """Returns the first word of a '>' or '@' header line, or the line
+    number when it has none."""
+    words = header[1:].split()
+    return words[0].decode('latin-1') if words else str(number)
+
+
+def stream_records(stream):
+    """Yields the records of a binary stream, or of a memory map, read line
+    by line."""
+    lines = enumerate(iter(stream.readline, b''), 1)
+    for number, line in lines:
+        if line.strip():
+            break
+    else:
+        return
+    if line.startswith(b'>'):
+        records = fasta_records(lines, line, number)
+    elif line.startswith(b'@'):
+        records = fastq_records(lines, line, number)
+    else:
+        records = plain_records(lines, line, number)
+    for record in records:
+        yield record
+
+
+def plain_records(lines, line, number):
+    yield str(number), line.strip().decode('latin-1')
+    for number, line in lines:
+        line = line.strip()
+        if line:
+            yield str(number), line.decode('latin-1')
+
+
+def fasta_records(lines, header, number):
+    name, parts = fasta_name(header, number), []
+    for number, line in lines:
+        if line.startswith(b'>'):
+            yield name, b''.join(parts).decode('latin-1')
+            name, parts = fasta_name(line, number), []
+        else:
+            parts.append(line.strip())
+    yield name, b''.join(parts).decode('latin-1')
+
+
+def fastq_records(lines, header, number):
+    """Yields the records of a FASTQ file, whose sequence lines end at a
+    '+' line followed by as many quality characters."""
+    while header is not None:
+        name, parts = fasta_name(header, number), []
+        for number, line in lines:
+            if line.startswith(b'+'):
+                break
+            parts.append(line.strip())
+        sequence = b''.join(parts)
+        quality = 0
+        for number, line in lines:
+            quality += len(line.strip())
+            if quality >= len(sequence):
+                break
+        yield name, sequence.decode('latin-1')
+        header = None
+        for number, line in lines:
+            if line.strip():
+                header = line
+                break
+
+
+def case_normalizer(grammar):
+    """Returns str.lower or str.upper when the letters of the terminals of a
+    CompiledGrammar are all of one case, or None."""
+    letters = "".join(char for char in grammar.terminal_table
+                      if char.isalpha())
+    if letters.islower():
+        return str.lower
+    if letters.isupper():
+        return str.upper
+    return None
+
+
+def normalize_case(records, grammar):
+    """Yields the records with their sequences in the case of the terminals
+    of grammar."""
+    normalize = case_normalizer(grammar)
+    if normalize is None:
+        return records
+    return ((name, normalize(sequence)) for name, sequence in records)
+
+
+def format_text(input_string, result, max_errors=None):
+    """Returns the result of find_correction for input_string as printed by
+    run_parser, or the LookupError it raised."""
+    if isinstance(result, LookupError):
+        return "I : %s\nI': %s\nE : -" % (input_string, result)
+    if result is None:
+        return "I : %s\nI': over threshold\nE : >%d" % (input_string,
+                                                        max_errors)
+    errors, corrected_string = result
+    return "I : %s\nI': %s\nE : %d" % (input_string, corrected_string, errors)
+
+
+class ResultWriter(object):
+    """Writes the results of try_correction to a text stream in one of
+    FORMATS, gathering about WRITE_BUFFER characters, or the results of at
+    most FLUSH_INTERVAL seconds, before each write. flush writes out what
+    is pending, and is called by error_parser before a parse or a chunk of
+    results that may take a while.
+    Results over the threshold have null errors and correction in JSON
+    lines and '-' in tab separated values. Inputs that could not be parsed
+    have null errors and correction and an "error" message in JSON lines,
+    and '-' errors and the message for the correction in tab separated
+    values."""
+    def __init__(self, output, output_format='text', max_errors=None):
+        self.output = output
+        self.format = output_format
+        self.max_errors = max_errors
+        self.pending = []
+        self.pending_size = 0
+        self.flushed = time.monotonic()
+
+    def write(self, name, input_string, result):
+        if self.format == 'text':
+            line = format_text(input_string, result, self.max_errors) + "\n"
+        elif self.format == 'jsonl':
+            record = {'name': name, 'input': input_string, 'errors': None,
+                      'corrected': None}
+            if isinstance(result, LookupError):
+                record['error'] = str(result)
+            elif result is not None:
+                record['errors'], record['corrected'] = result
+            line = json.dumps(record) + "\n"
+        elif isinstance(result, LookupError):
+            line = "%s\t%s\t-\t%s\n" % (name, input_string, result)
+        else:
+            errors, corrected = result if result is not None else ('-', '-')
+            line = "%s\t%s\t%s\t%s\n" % (name, input_string, errors,
+                                          corrected)
+        self.pending.append(line)
+        self.pending_size += len(line)
+        if self.pending_size >= WRITE_BUFFER or \
+                time.monotonic() - self.flushed >= FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        self.output.write("".join(self.pending))
+        self.output.flush()
+        self.pending = []
+        self.pending_size = 0
+        self.flushed = time.monotonic()
@@ -0,0 +1,164 @@
+import numpy as np
+
+from classes import not_found
+from dense_parser import DenseGrammar, DenseTable, dense_tree
+
+# Blocks whose side is at most LEAF_SIZE are completed cell by cell instead
+# of being split further, which saves the many tiny products at the bottom
+# of the recursion.
+LEAF_SIZE = 8
+# Products with an inner dimension below DIRECT_SIZE are computed with a
+# plain min-plus reduction rather than through a matrix multiplication.
+DIRECT_SIZE = 16
+# Cost bounds tried by valiant_parser. Every cell is clipped to the bound,
+# and a larger bound is only needed when the input has more errors.
+INITIAL_BOUND = 16
+MAX_BOUND = 256
+
+
+def distance_product(left, right, bound):
+    """Min-plus product of the stacks left (p, x, y) and right (p, y, z).
+    Finite entries must be integers in [0, bound], and results above bound
+    are returned as infinity. Small bounds are encoded as powers
+    (y+1)**(bound-cost) so that the product becomes one float matrix
+    multiplication whose largest term gives the smallest sum."""
+    inner = left.shape[2]
+    base = float(inner + 1)
+    if (bound is None or inner < DIRECT_SIZE or
+            (2 * bound + 1) * np.log10(base) >= 300):
+        result = np.full(left.shape[:2] + right.shape[2:], np.inf,
+                         dtype=np.float32)
+        for k in range(inner):
+            np.minimum(result, left[:, :, k, None] + right[:, None, k, :],
+                       out=result)
+    else:
+        encoded = np.matmul(
+            np.power(base, bound - left.astype(np.float64)),
+            np.power(base, bound - right.astype(np.float64)))
+        with np.errstate(divide='ignore'):
+            exponent = np.floor(np.log(encoded) / np.log(base) + 1e-9)
+        result = (2 * bound - exponent).astype(np.float32)
+    if bound is not None:
+        result[result > bound] = np.inf
+    return result
+
+
+class ValiantParser(object):
+    """Valiant style CYK fill in the form given by Okhotin: the table is
+    split recursively into blocks, and all the split points between two
+    blocks are combined at once through distance products. P holds, for
+    every distinct right hand side (B, C), the best combined cost found so
+    far for each cell."""
+    def __init__(self, grammar, input_string, bound):
+        self.grammar = grammar
+        self.dense = DenseGrammar(grammar)
+        self.bound = bound
+        size = 1
+        while size < len(input_string) + 1:
+            size *= 2
+        self.size = size
+        self.limit = len(input_string) + 1
+        self.table = DenseTable(grammar, size - 1)
+        self.pairs = np.full((len(self.dense.pair_left), size, size),
+                             np.inf, dtype=np.float32)
+        data = self.table.data
+        for i, char in enumerate(input_string):
+            for A, errors, _ in grammar.terminal_table.get(char, ()):
+                data[A, i, i+1] = min(data[A, i, i+1], errors)
+        if bound is not None:
+            data[data > bound] = np.inf
+
+    def compute(self, l, m):
+        if m - l >= 4:
+            self.compute(l, (l+m) // 2)
+            self.compute((l+m) // 2, m)
+        self.complete(l, (l+m) // 2, (l+m) // 2, m)
+
+    def complete(self, l, m, l2, m2):
+        """Fills the block of rows [l, m) and columns [l2, m2) once the
+        blocks on its diagonal are done and self.pairs holds every split
+        point strictly between m and l2. Cells that end past the input are
+        padding and stay unreachable, so those blocks are skipped."""
+        if l2 >= self.limit:
+            return
+        if m - l <= LEAF_SIZE:
+            self.complete_leaf(l, m, l2, min(m2, self.limit))
+            return
+        mid, mid2 = (l+m) // 2, (l2+m2) // 2
+        self.complete(mid, m, l2, mid2)
+        self.multiply((l, mid), (mid, m), (l2, mid2))
+        self.complete(l, mid, l2, mid2)
+        self.multiply((mid, m), (l2, mid2), (mid2, m2))
+        self.complete(mid, m, mid2, m2)
+        self.multiply((l, mid), (mid, m), (mid2, m2))
+        self.multiply((l, mid), (l2, mid2), (mid2, m2))
+        self.complete(l, mid, mid2, m2)
+
+    def complete_leaf(self, l, m, l2, m2):
+        """Fills a small block one span length at a time, adding the split
+        points inside the two blocks. Cells of equal span only depend on
+        shorter ones and all have the same number of such split points, so
+        each span is filled with one vectorized step."""
+        dense = self.dense
+        data = self.table.data
+        pair_left = dense.pair_left[:, None, None]
+        pair_right = dense.pair_right[:, None, None]
+        for depth in range(max(l2 - m + 1, 2), m2 - l):
+            starts = np.arange(max(l, l2 - depth), min(m, m2 - depth))
+            ends = starts + depth
+            # The t-th split of the cell starting at i is i+1+t inside the
+            # row block and jumps over [m, l2) once it passes m-1.
+            offsets = np.arange(depth + m - l2 - 1)[None, :]
+            splits = (starts[:, None] + 1 + offsets +
+                      (offsets >= m - 1 - starts[:, None]) * (l2 - m))
+            pairs = self.pairs[:, starts, ends]
+            if splits.shape[1]:
+                pairs = np.minimum(pairs, (
+                    data[pair_left, starts[:, None], splits] +
+                    data[pair_right, splits, ends[:, None]]).min(axis=2))
+            costs = pairs[dense.rule_pair] + dense.rule_cost[:, None]
+            best = np.minimum.reduceat(costs, dense.group_start, axis=0)
+            if self.bound is not None:
+                best[best > self.bound] = np.inf
+            data[dense.group_lhs[:, None], starts, ends] = best
+
+    def multiply(self, rows, splits, cols):
+        """Adds T[rows, splits] x T[splits, cols] into P[rows, cols]."""
+        cols = (cols[0], min(cols[1], self.limit))
+        if splits[0] >= self.limit or cols[0] >= cols[1]:
+            return
+        dense = self.dense
+        data = self.table.data
+        left = data[:, rows[0]:rows[1], splits[0]:splits[1]]
+        right = data[:, splits[0]:splits[1], cols[0]:cols[1]]
+        product = distance_product(left[dense.pair_left],
+                                   right[dense.pair_right], self.bound)
+        block = self.pairs[:, rows[0]:rows[1], cols[0]:cols[1]]
+        np.minimum(block, product, out=block)
+
+
+def valiant_parser(grammar, input_string, max_errors=None):
+    """Takes a CompiledGrammar and an input string and returns the same
+    (errors, tree) tuple as error_correcting_parser using ValiantParser.
+    Costs above the bound are dropped, which keeps the distance products
+    small. The bound is max_errors when given; otherwise it starts at
+    INITIAL_BOUND and is doubled while no parse fits, and past MAX_BOUND the
+    fill is repeated without one.
+    """
+    input_size = len(input_string)
+    bound = INITIAL_BOUND if max_errors is None else max_errors
+    if not len(grammar.rule_lhs) and max_errors is None:
+        bound = None
+    while True:
+        parser = ValiantParser(grammar, input_string, bound)
+        if len(parser.dense.rule_pair):
+            parser.compute(0, parser.size)
+        least_err = parser.table.data[grammar.top, 0, input_size]
+        if np.isfinite(least_err) or bound is None or max_errors is not None:
+            break
+        bound = bound * 2 if bound < MAX_BOUND else None
+    if not np.isfinite(least_err):
+        raise not_found(max_errors)
+    least_err = int(least_err)
+    tree = dense_tree(parser.table, parser.dense, input_string, least_err)
+    return least_err, tree
@@ -0,0 +1,130 @@
+import copy
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from classes import not_found
+from dense_parser import (BLOCK_SIZE, DenseGrammar, DenseTable, dense_tree,
+                          fill_span)
+
+# Spans of a depth whose combinations number less than PARALLEL_WORK are
+# filled by the calling process, where handing them to the workers would
+# cost more than it saves.
+PARALLEL_WORK = 1 << 20
+
+# Pool of worker processes of this process and its size, started by
+# worker_pool on first use and kept for the later parses.
+pool_state = {}
+
+
+class SharedTable(DenseTable):
+    """DenseTable whose array lives in a shared memory block, so that worker
+    processes fill their cells in place and read the shorter spans without
+    copying. Without a name a new block is created and cleared."""
+    def __init__(self, shape, name=None):
+        size = int(np.prod(shape)) * np.dtype(np.float32).itemsize
+        if name is None:
+            self.memory = shared_memory.SharedMemory(create=True,
+                                                     size=max(size, 1))
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.data = np.ndarray(shape, dtype=np.float32, buffer=self.memory.buf)
+        if name is None:
+            self.data.fill(np.inf)
+
+    def close(self):
+        self.data = None
+        self.memory.close()
+
+
+def fill_chunk(name, shape, dense, limits, depth, start, stop):
+    """Fills the cells [i, i+depth) for start <= i < stop of the SharedTable
+    called name in a worker, in blocks of at most BLOCK_SIZE values like
+    dense_parser. The table is attached for the call only, so that workers
+    hold no table once its parse is done."""
+    table = SharedTable(shape, name)
+    try:
+        step = max(1, BLOCK_SIZE // (len(dense.pair_left) * (depth - 1)))
+        for block in range(start, stop, step):
+            fill_span(table, dense, depth, block, min(stop, block + step),
+                      limits)
+    finally:
+        table.close()
+
+
+def worker_pool(jobs):
+    """Returns a pool of jobs worker processes, started once and reused by
+    every parse of this process with the same number of jobs."""
+    if pool_state.get('jobs') != jobs:
+        if 'pool' in pool_state:
+            pool_state['pool'].shutdown()
+        pool_state['pool'] = ProcessPoolExecutor(max_workers=jobs)
+        pool_state['jobs'] = jobs
+    return pool_state['pool']
+
+
+def worker_count():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def wavefront_parser(grammar, input_string, max_errors=None, jobs=None):
+    """Takes a CompiledGrammar and an input string and returns the same
+    (errors, tree) tuple as error_correcting_parser. The dense table is
+    filled one depth at a time as in dense_parser, but the starts of each
+    depth are split among jobs worker processes (one per available CPU by
+    default). The cells of a depth only read shorter spans, so the workers
+    need no other synchronization than waiting for the whole depth.
+    """
+    input_size = len(input_string)
+    jobs = jobs or worker_count()
+    dense = DenseGrammar(grammar)
+    shape = (grammar.size, input_size + 1, input_size + 1)
+    table = SharedTable(shape)
+    try:
+        limits = np.array(grammar.error_limits(max_errors), dtype=np.float32)
+        for i in range(input_size):
+            for A, errors, _ in grammar.terminal_table.get(input_string[i],
+                                                            ()):
+                if errors <= limits[A]:
+                    table.data[A, i, i+1] = min(table.data[A, i, i+1],
+                                                errors)
+        if len(dense.rule_pair):
+            fill_depths(table, dense, limits, input_size, jobs)
+        least_err = table.data[grammar.top, 0, input_size]
+        if not np.isfinite(least_err):
+            raise not_found(max_errors)
+        least_err = int(least_err)
+        tree = dense_tree(table, dense, input_string, least_err)
+    finally:
+        table.close()
+        table.memory.unlink()
+    return least_err, tree
+
+
+def fill_depths(table, dense, limits, input_size, jobs):
+    """Fills every depth of the table in order, handing the starts of the
+    large ones to the worker_pool of jobs workers in equal chunks."""
+    arrays = copy.copy(dense)
+    arrays.grammar = None
+    arrays.lhs_rules = None
+    setup = (table.memory.name, table.data.shape, arrays, limits)
+    for depth in range(2, input_size + 1):
+        starts = input_size - depth + 1
+        work = len(dense.pair_left) * (depth - 1) * starts
+        if jobs < 2 or work < PARALLEL_WORK:
+            step = max(1, BLOCK_SIZE // (len(dense.pair_left) * (depth - 1)))
+            for start in range(0, starts, step):
+                fill_span(table, dense, depth, start,
+                          min(starts, start + step), limits)
+            continue
+        chunk = -(-starts // jobs)
+        futures = [worker_pool(jobs).submit(fill_chunk, *setup, depth, start,
+                                            min(starts, start + chunk))
+                   for start in range(0, starts, chunk)]
+        for future in futures:
+            future.result()